@@ -8,6 +8,7 @@ from psycopg2.extensions import connection as _connection
 
 from postgres_to_es.extract import StatePostgres
 from postgres_to_es.load import ESLoader
+from postgres_to_es.publish import CachePublisher
 from postgres_to_es.state import State, JsonFileStorage
 from pydantic_config import config, INDEX_NAME_MOVIE, INDEX_NAME_GENRE, INDEX_NAME_PERSON
 
@@ -17,7 +18,10 @@ logger = logging.getLogger()
 @backoff.on_exception(backoff.expo, (elasticsearch.exceptions.ConnectionError, psycopg2.OperationalError), max_time=10)
 def etl_run(cursor: _connection):
     logger.info('Start ETL')
-    state_postgres = StatePostgres(cursor, ESLoader(config.elastic_connection.url_elastic))
+    publisher = None
+    if config.redis_connection:
+        publisher = CachePublisher(config.redis_connection.url_redis, config.redis_connection.invalidation_channel)
+    state_postgres = StatePostgres(cursor, ESLoader(config.elastic_connection.url_elastic, publisher))
     state = State(JsonFileStorage(config.film_work_pg.state_file_path))
 
     updated_person = state.get_state('person')
@@ -84,6 +88,11 @@ def create_index_movies(es: elasticsearch.Elasticsearch):
                     "russian_stemmer": {
                         "type": "stemmer",
                         "language": "russian"
+                    },
+                    "autocomplete_filter": {
+                        "type": "edge_ngram",
+                        "min_gram": 1,
+                        "max_gram": 20
                     }
                 },
                 "analyzer": {
@@ -97,6 +106,19 @@ def create_index_movies(es: elasticsearch.Elasticsearch):
                             "russian_stop",
                             "russian_stemmer"
                         ]
+                    },
+                    "autocomplete": {
+                        "tokenizer": "standard",
+                        "filter": [
+                            "lowercase",
+                            "autocomplete_filter"
+                        ]
+                    },
+                    "autocomplete_search": {
+                        "tokenizer": "standard",
+                        "filter": [
+                            "lowercase"
+                        ]
                     }
                 }
             }
@@ -132,6 +154,11 @@ def create_index_movies(es: elasticsearch.Elasticsearch):
                     "fields": {
                         "raw": {
                             "type": "keyword"
+                        },
+                        "suggest": {
+                            "type": "text",
+                            "analyzer": "autocomplete",
+                            "search_analyzer": "autocomplete_search"
                         }
                     }
                 },
@@ -284,6 +311,11 @@ def create_index_persons(es: elasticsearch.Elasticsearch):
                     "russian_stemmer": {
                         "type": "stemmer",
                         "language": "russian"
+                    },
+                    "autocomplete_filter": {
+                        "type": "edge_ngram",
+                        "min_gram": 1,
+                        "max_gram": 20
                     }
                 },
                 "analyzer": {
@@ -297,6 +329,19 @@ def create_index_persons(es: elasticsearch.Elasticsearch):
                             "russian_stop",
                             "russian_stemmer"
                         ]
+                    },
+                    "autocomplete": {
+                        "tokenizer": "standard",
+                        "filter": [
+                            "lowercase",
+                            "autocomplete_filter"
+                        ]
+                    },
+                    "autocomplete_search": {
+                        "tokenizer": "standard",
+                        "filter": [
+                            "lowercase"
+                        ]
                     }
                 }
             }
@@ -308,7 +353,14 @@ def create_index_persons(es: elasticsearch.Elasticsearch):
                     "type": "keyword"
                 },
                 "full_name": {
-                    "type": "text"
+                    "type": "text",
+                    "fields": {
+                        "suggest": {
+                            "type": "text",
+                            "analyzer": "autocomplete",
+                            "search_analyzer": "autocomplete_search"
+                        }
+                    }
                 },
                 "birth_date": {
                     "type": "date"
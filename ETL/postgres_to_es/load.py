@@ -1,16 +1,22 @@
 import json
 import logging
-from typing import List
+from typing import List, Optional, Set
 from urllib.parse import urljoin
 
 import requests
 
+from postgres_to_es.publish import CachePublisher
+from pydantic_config import INDEX_NAME_MOVIE, INDEX_NAME_PERSON
+
 logger = logging.getLogger()
 
+PERSON_FIELDS = ('actors', 'writers', 'directors')
+
 
 class ESLoader:
-    def __init__(self, url: str):
+    def __init__(self, url: str, publisher: Optional[CachePublisher] = None):
         self.url = url
+        self.publisher = publisher
 
     def _get_es_bulk_query(self, rows: List[dict], index_name: str) -> List[str]:
         '''
@@ -31,15 +37,62 @@ class ESLoader:
         prepared_query = self._get_es_bulk_query(records, index_name)
         str_query = '\n'.join(prepared_query) + '\n'
 
+        previous_persons = set()
+        if self.publisher and index_name == INDEX_NAME_MOVIE:
+            # Состав фильма до перезаписи: персонам, которых из него убрали, тоже нужно сбросить кеш
+            previous_persons = self._get_movie_persons([str(record['id']) for record in records])
+
+        # refresh=wait_for: ответ приходит, когда загруженные документы уже видны поиску. Иначе API,
+        # получив сообщение о сбросе кеша, успело бы пересобрать ответы по старому индексу и закешировать их
         response = requests.post(
-            urljoin(self.url, '_bulk'),
+            urljoin(self.url, '_bulk?refresh=wait_for'),
             data=str_query,
             headers={'Content-Type': 'application/x-ndjson'}
         )
 
         json_response = json.loads(response.content.decode())
+        loaded_ids = []
         for item in json_response['items']:
             error_message = item['index'].get('error')
             if error_message:
                 logger.error(error_message)
+            else:
+                loaded_ids.append(item['index']['_id'])
+
+        if self.publisher:
+            self._publish_loaded(records, loaded_ids, index_name, previous_persons)
+
+    def _get_movie_persons(self, movie_ids: List[str]) -> Set[str]:
+        '''
+        Идентификаторы персон, которые сейчас указаны в фильмах индекса
+        '''
+        response = requests.post(
+            urljoin(self.url, f'{INDEX_NAME_MOVIE}/_mget'),
+            params={'_source_includes': ','.join(f'{field}.id' for field in PERSON_FIELDS)},
+            json={'ids': movie_ids}
+        )
+        docs = json.loads(response.content.decode()).get('docs', [])
+        return {
+            str(person['id'])
+            for doc in docs if doc.get('found')
+            for field in PERSON_FIELDS
+            for person in doc['_source'].get(field, [])
+        }
+
+    def _publish_loaded(self, records: List[dict], loaded_ids: List[str], index_name: str,
+                        previous_persons: Set[str]):
+        '''
+        Публикует идентификаторы успешно загруженных документов для сброса кешей API
+        '''
+        self.publisher.publish(index_name, loaded_ids)
+        if index_name == INDEX_NAME_MOVIE:
+            # Состав фильма входит в ответ по персоне, поэтому сбрасываем и её
+            loaded = set(loaded_ids)
+            person_ids = {
+                str(person['id'])
+                for record in records if str(record['id']) in loaded
+                for field in PERSON_FIELDS
+                for person in record.get(field, [])
+            }
+            self.publisher.publish(INDEX_NAME_PERSON, sorted(person_ids | previous_persons))
 
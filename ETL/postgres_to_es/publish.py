@@ -0,0 +1,28 @@
+import json
+import logging
+from typing import List
+
+import redis
+
+logger = logging.getLogger()
+
+
+class CachePublisher:
+    """
+    Сообщает API, какие документы были переиндексированы, чтобы оно сбросило их из своих кешей.
+    Сообщения уходят в канал Redis pub/sub и получаются каждым воркером API.
+    """
+
+    def __init__(self, url: str, channel: str):
+        self.redis = redis.Redis.from_url(url)
+        self.channel = channel
+
+    def publish(self, index_name: str, ids: List[str]):
+        if not ids:
+            return
+        message = json.dumps({'index': index_name, 'ids': ids}, default=str)
+        try:
+            self.redis.publish(self.channel, message)
+        except redis.exceptions.RedisError as error:
+            # Инвалидация не должна ломать загрузку: устаревшие записи всё равно истекут по TTL
+            logger.error(f'Cache invalidation for {index_name} failed: {error}')
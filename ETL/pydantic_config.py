@@ -24,9 +24,15 @@ class ElasticSettings(BaseModel):
     url_elastic: str
 
 
+class RedisSettings(BaseModel):
+    url_redis: str
+    invalidation_channel: str
+
+
 class Config(BaseModel):
     film_work_pg: PostgresSettings
     elastic_connection: ElasticSettings
+    redis_connection: Optional[RedisSettings]
 
 
 config = Config.parse_file('config.json')
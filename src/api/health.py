@@ -0,0 +1,24 @@
+from http import HTTPStatus
+from typing import Dict
+
+from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
+
+from core.readiness import readiness
+
+router = APIRouter()
+
+
+@router.get('/health/live', include_in_schema=False)
+async def liveness() -> Dict[str, str]:
+    # Процесс жив и обслуживает цикл событий
+    return {'status': 'alive'}
+
+
+@router.get('/health/ready', include_in_schema=False)
+async def ready() -> ORJSONResponse:
+    status = HTTPStatus.OK if readiness.ready else HTTPStatus.SERVICE_UNAVAILABLE
+    return ORJSONResponse(
+        status_code=status,
+        content={'warmed': readiness.warmed, 'draining': readiness.draining},
+    )
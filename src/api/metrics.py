@@ -0,0 +1,29 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from core import metrics
+from db import cache, elastic, redis
+
+router = APIRouter()
+
+
+def collect_pools():
+    # Загрузку пулов и кеша снимаем в момент запроса метрик, а не на каждом обращении к ним
+    for state, value in redis.stats().items():
+        metrics.POOL_CONNECTIONS.set('redis', 'redis', state, value=value)
+    for node, node_stats in elastic.stats().items():
+        for state, value in node_stats.items():
+            metrics.POOL_CONNECTIONS.set('elastic', node, state, value=value)
+    for field, value in elastic.limiter.stats().items():
+        metrics.ELASTIC_LIMITER.set(field, value=value)
+    for field, value in elastic.breaker.stats().items():
+        metrics.ELASTIC_BREAKER.set(field, value=value)
+    for component, component_stats in cache.cache.stats().items():
+        for field, value in component_stats.items():
+            metrics.CACHE_STATE.set(component, field, value=value)
+
+
+@router.get('/metrics', response_class=PlainTextResponse, include_in_schema=False)
+async def metrics_export() -> PlainTextResponse:
+    collect_pools()
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
@@ -0,0 +1,26 @@
+from http import HTTPStatus
+from typing import Optional
+
+from fastapi import Request, Response
+
+from core import config
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # If-None-Match сравнивается слабо: W/"x" и "x" считаются одной версией
+    return any(x.strip().replace('W/', '', 1) == etag for x in if_none_match.split(','))
+
+
+def etag_response(request: Request, etag: str, body: bytes) -> Response:
+    """Ответ с ETag и Cache-Control; если у клиента та же версия, отдаём 304 без тела."""
+    headers = {
+        'ETag': etag,
+        'Cache-Control': f'public, max-age={config.HTTP_CACHE_MAX_AGE_IN_SECONDS}',
+    }
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type='application/json', headers=headers)
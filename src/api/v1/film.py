@@ -1,14 +1,20 @@
 from http import HTTPStatus
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 from uuid import UUID
 from typing import List, Optional
 
+from api.v1.conditional import etag_response
+from api.v1.pagination import parse_cursor, set_next_cursor
+from models.film import Film
 from services.film import FilmService, get_film_service
 
 router = APIRouter()
 
+FILM_BATCH_MAX_SIZE = 100
+
 
 class FilmMain(BaseModel):
     uuid: UUID
@@ -24,43 +30,78 @@ class FilmDetail(FilmMain):
     directors: List[dict]
 
 
+def film_detail(film: Film) -> FilmDetail:
+    # Перекладываем данные из models.Film в FilmDetail
+    # Если бы использовалась общая модель для бизнес-логики и формирования ответов API
+    # вы бы предоставляли клиентам данные, которые им не нужны
+    # и, возможно, данные, которые опасно возвращать
+    return FilmDetail(uuid=film.id, title=film.title, imdb_rating=film.imdb_rating, description=film.description,
+                      genre=film.genres, actors=film.actors, writers=film.writers, directors=film.directors)
+
+
+def render_film_detail(film: Film) -> bytes:
+    return orjson.dumps(film_detail(film).dict())
+
+
 @router.get('/search/')
 async def film_search(
+        response: Response,
         query: str,
-        page_size: int = Query(50, alias="page[size]"),
+        page_size: int = Query(50, alias="page[size]", ge=1),
         page_number: int = Query(1, alias="page[number]"),
+        cursor: Optional[str] = Query(None, alias="page[cursor]"),
         film_service: FilmService = Depends(get_film_service)) -> List[FilmMain]:
-    films_all_fields_search = await film_service.get_film_search(query, page_size, page_number)
+    if cursor is not None:
+        films_all_fields_search, last_sort = await film_service.get_film_search_after(
+            query, page_size, parse_cursor(cursor))
+        set_next_cursor(response, last_sort)
+    else:
+        films_all_fields_search = await film_service.get_film_search(query, page_size, page_number)
     films = [FilmMain(uuid=x.id, title=x.title, imdb_rating=x.imdb_rating) for x in films_all_fields_search]
     return films
 
 
 # Внедряем FilmService с помощью Depends(get_film_service)
 @router.get('/<uuid:UUID>/', response_model=FilmDetail)
-async def film_details(film_id: str, film_service: FilmService = Depends(get_film_service)) -> FilmDetail:
-    film = await film_service.get_by_id(film_id)
-    if not film:
+async def film_details(request: Request, film_id: str,
+                       film_service: FilmService = Depends(get_film_service)) -> FilmDetail:
+    data = await film_service.get_response_by_id(film_id, render_film_detail)
+    if not data:
         # Если фильм не найден, отдаём 404 статус
         # Желательно пользоваться уже определёнными HTTP-статусами, которые содержат enum
         # Такой код будет более поддерживаемым
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='film not found')
 
-        # Перекладываем данные из models.Film в Film
-        # Обратите внимание, что у модели бизнес-логики есть поле description
-        # Которое отсутствует в модели ответа API.
-        # Если бы использовалась общая модель для бизнес-логики и формирования ответов API
-        # вы бы предоставляли клиентам данные, которые им не нужны
-        # и, возможно, данные, которые опасно возвращать
-    return FilmDetail(uuid=film.id, title=film.title, imdb_rating=film.imdb_rating, description=film.description,
-                      genre=film.genres, actors=film.actors, writers=film.writers, directors=film.directors)
+    # Тело ответа уже сериализовано по схеме FilmDetail — отдаём байты из кеша как есть,
+    # а если у клиента та же версия, то только 304
+    return etag_response(request, *data)
+
+
+@router.get('/batch/', response_model=List[FilmDetail])
+async def film_batch(ids: List[UUID] = Query(...),
+                     film_service: FilmService = Depends(get_film_service)) -> List[FilmDetail]:
+    if len(ids) > FILM_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail=f'no more than {FILM_BATCH_MAX_SIZE} ids per request')
+    films = await film_service.get_by_ids([str(x) for x in ids])
+    return [film_detail(x) for x in films]
 
 
 @router.get('/')
-async def film_main(sort: str = "-imdb_rating",
-                    page_size: int = Query(50, alias="page[size]"),
+async def film_main(response: Response,
+                    sort: str = "-imdb_rating",
+                    page_size: int = Query(50, alias="page[size]", ge=1),
                     page_number: int = Query(1, alias="page[number]"),
-                    filter_genre: str = Query(None, alias="filter[genre]"),
+                    filter_genre: Optional[UUID] = Query(None, alias="filter[genre]"),
+                    cursor: Optional[str] = Query(None, alias="page[cursor]"),
                     film_service: FilmService = Depends(get_film_service)) -> List[FilmMain]:
-    films_all_fields = await film_service.get_film_pagination(sort, page_size, page_number, filter_genre)
+    # genres.id — регистрозависимое keyword-поле: приводим UUID к каноническому виду до ключа кеша и запроса
+    filter_genre = str(filter_genre) if filter_genre else None
+    if cursor is not None:
+        films_all_fields, last_sort = await film_service.get_film_pagination_after(
+            sort, page_size, filter_genre, parse_cursor(cursor))
+        set_next_cursor(response, last_sort)
+    else:
+        films_all_fields = await film_service.get_film_pagination(sort, page_size, page_number, filter_genre)
     films = [FilmMain(uuid=x.id, title=x.title, imdb_rating=x.imdb_rating) for x in films_all_fields]
     return films
@@ -1,10 +1,12 @@
 from http import HTTPStatus
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from pydantic import BaseModel
 from uuid import UUID
 
+from api.v1.conditional import etag_response
 from services.genre import get_genre_service, GenreService
 
 router = APIRouter()
@@ -15,13 +17,30 @@ class Genre(BaseModel):
     name: str
 
 
+class GenreFacet(Genre):
+    count: int
+
+
+def render_genre(genre) -> bytes:
+    return orjson.dumps(Genre(uuid=genre.id, name=genre.name).dict())
+
+
 @router.get('/<uuid:UUID>/', response_model=Genre)
-async def genre_details(genre_id: str, genre_service: GenreService = Depends(get_genre_service)) -> Genre:
-    genre = await genre_service.genre_detail(genre_id)
-    if not genre:
+async def genre_details(request: Request, genre_id: str,
+                        genre_service: GenreService = Depends(get_genre_service)) -> Genre:
+    data = await genre_service.genre_detail_raw(genre_id, render_genre)
+    if not data:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='genre not found')
 
-    return Genre(uuid=genre.id, name=genre.name)
+    return etag_response(request, *data)
+
+
+@router.get('/facets/', response_model=List[GenreFacet])
+async def genre_facets(request: Request, query: Optional[str] = None,
+                       genre_service: GenreService = Depends(get_genre_service)) -> List[GenreFacet]:
+    # Счётчики рядом с фильтром по жанрам: одно чтение из кеша, а у клиента с той же версией — 304
+    data = await genre_service.genre_facets_raw(query)
+    return etag_response(request, *data)
 
 
 @router.get('/')
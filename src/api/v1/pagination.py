@@ -0,0 +1,19 @@
+from http import HTTPStatus
+from typing import Optional
+
+from fastapi import HTTPException, Response
+
+from core.cursor import decode_cursor, encode_cursor
+
+
+def parse_cursor(cursor: str) -> Optional[list]:
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail='invalid cursor')
+
+
+def set_next_cursor(response: Response, last_sort: Optional[list]):
+    # Курсор следующей страницы отдаём в заголовке, чтобы не менять формат ответа
+    if last_sort:
+        response.headers['X-Next-Cursor'] = encode_cursor(last_sort)
@@ -1,10 +1,12 @@
 from http import HTTPStatus
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 from uuid import UUID
 from typing import List, Optional, Tuple
 
+from api.v1.conditional import etag_response
+from api.v1.pagination import parse_cursor, set_next_cursor
 from services.person import PersonService, get_person_service
 
 router = APIRouter()
@@ -19,22 +21,29 @@ class Person(BaseModel):
 
 @router.get('/search/')
 async def person_details(
+        response: Response,
         query: str,
-        page_size: int = Query(50, alias="page[size]"),
+        page_size: int = Query(50, alias="page[size]", ge=1),
         page_number: int = Query(1, alias="page[number]"),
+        cursor: Optional[str] = Query(None, alias="page[cursor]"),
         person_service: PersonService = Depends(get_person_service)) -> Tuple[Person, Optional[List[dict]]]:
 
-    person = await person_service.person_search(query, page_size, page_number)
+    if cursor is not None:
+        person, last_sort = await person_service.person_search_after(query, page_size, parse_cursor(cursor))
+        set_next_cursor(response, last_sort)
+    else:
+        person = await person_service.person_search(query, page_size, page_number)
 
     return person
 
 
 @router.get('/<uuid:UUID>/')
 async def person_details(
+        request: Request,
         person_id: str,
         person_service: PersonService = Depends(get_person_service)) -> Tuple[Person, Optional[List[dict]]]:
 
-    person = await person_service.person_detail(person_id)
-    if not person:
+    data = await person_service.person_detail_raw(person_id)
+    if not data:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='person not found')
-    return person
+    return etag_response(request, *data)
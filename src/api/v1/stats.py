@@ -0,0 +1,22 @@
+import os
+from typing import Dict, Any
+
+from fastapi import APIRouter
+
+from db import cache, elastic, redis
+
+router = APIRouter()
+
+
+@router.get('/')
+async def service_stats() -> Dict[str, Any]:
+    # Загрузка пулов и кешей процесса: по ним подбираются размеры пулов для конкретного развёртывания
+    return {
+        # Воркеры делят один сокет, поэтому ответ нужно относить к процессу, который его дал
+        'worker': os.getpid(),
+        'redis_pool': redis.stats(),
+        'elastic_pool': elastic.stats(),
+        'elastic_limiter': elastic.limiter.stats(),
+        'elastic_breaker': elastic.breaker.stats(),
+        'cache': cache.cache.stats(),
+    }
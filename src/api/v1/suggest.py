@@ -0,0 +1,30 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, Query, Response
+from pydantic import BaseModel
+from uuid import UUID
+
+from services.suggest import SuggestService, get_suggest_service
+
+router = APIRouter()
+
+SUGGEST_MAX_SIZE = 20
+
+
+class Suggestion(BaseModel):
+    uuid: UUID
+    label: str
+
+
+class Suggestions(BaseModel):
+    films: List[Suggestion]
+    persons: List[Suggestion]
+
+
+@router.get('/', response_model=Suggestions)
+async def suggest(query: str = Query(..., min_length=1, max_length=100),
+                  size: int = Query(10, ge=1, le=SUGGEST_MAX_SIZE),
+                  suggest_service: SuggestService = Depends(get_suggest_service)) -> Suggestions:
+    # Ответ собран из _source и уже сериализован, поэтому отдаём байты без повторной валидации
+    data = await suggest_service.suggest_raw(query, size)
+    return Response(content=data, media_type='application/json')
@@ -0,0 +1,61 @@
+"""
+Синтетический каталог для нагрузочных прогонов: жанры, персоны и фильмы
+в том же виде, в каком их кладёт в индексы ETL.
+"""
+import random
+import uuid
+from typing import Dict
+
+Catalog = Dict[str, Dict[str, dict]]
+
+WORDS = (
+    'star', 'war', 'love', 'night', 'dark', 'city', 'last', 'dream', 'blood', 'king', 'space', 'river',
+    'ghost', 'secret', 'winter', 'fire', 'road', 'heart', 'storm', 'island', 'shadow', 'empire', 'return',
+)
+GENRES = (
+    'Action', 'Adventure', 'Animation', 'Comedy', 'Crime', 'Documentary', 'Drama', 'Family', 'Fantasy',
+    'History', 'Horror', 'Music', 'Mystery', 'Romance', 'Sci-Fi', 'Thriller', 'War', 'Western',
+)
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _phrase(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def generate_catalog(films: int = 5000, persons: int = 2000, seed: int = 0) -> Catalog:
+    """Каталог детерминирован для заданного seed, поэтому прогоны между собой сравнимы."""
+    rng = random.Random(seed)
+    genres = [{'id': _uuid(rng), 'name': name, 'description': ''} for name in GENRES]
+    people = [
+        {'id': _uuid(rng), 'full_name': f'{_phrase(rng, 1)} {_phrase(rng, 1)}', 'birth_date': None}
+        for _ in range(persons)
+    ]
+    movies = {}
+    for _ in range(films):
+        film_genres = rng.sample(genres, rng.randint(1, 3))
+        cast = [{'id': x['id'], 'name': x['full_name']} for x in rng.sample(people, rng.randint(3, 15))]
+        directors, writers, actors = cast[:1], cast[1:3], cast[3:]
+        film_id = _uuid(rng)
+        movies[film_id] = {
+            'id': film_id,
+            'title': _phrase(rng, rng.randint(1, 4)),
+            'description': _phrase(rng, rng.randint(10, 40)),
+            'imdb_rating': round(rng.uniform(1, 10), 1),
+            'genre': [x['name'] for x in film_genres],
+            'genres': [{'id': x['id'], 'name': x['name']} for x in film_genres],
+            'directors': directors,
+            'writers': writers,
+            'actors': actors,
+            'directors_names': [x['name'] for x in directors],
+            'writers_names': [x['name'] for x in writers],
+            'actors_names': [x['name'] for x in actors],
+        }
+    return {
+        'movies': movies,
+        'genres': {x['id']: x for x in genres},
+        'persons': {x['id']: x for x in people},
+    }
@@ -0,0 +1,434 @@
+"""
+Заменители AsyncElasticsearch и aioredis в памяти процесса для прогонов без внешних сервисов.
+Реализуют только то подмножество API и DSL запросов, которым пользуются сервисы.
+Задержка сети задаётся явно, чтобы прогоны показывали поведение приложения при медленном бэкенде.
+"""
+import asyncio
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from aioredis import Redis
+from elasticsearch import ConnectionError as ElasticConnectionError, NotFoundError
+
+from benchmarks.catalog import Catalog
+
+# (совпал ли документ, релевантность, имена совпавших именованных запросов)
+Match = Tuple[bool, float, List[str]]
+
+
+def _field_values(doc: dict, field: str) -> List[Any]:
+    value = doc.get(field)
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _text_score(doc: dict, query: str, fields: List[str]) -> float:
+    tokens = query.lower().split()
+    score = 0.0
+    for field in fields:
+        name, _, boost = field.partition('^')
+        counts = Counter(' '.join(str(x) for x in _field_values(doc, name)).lower().split())
+        score += float(boost or 1) * sum(counts[token] for token in tokens)
+    return score
+
+
+def _evaluate(doc: dict, query: dict) -> Match:
+    if not query or 'match_all' in query:
+        return True, 1.0, []
+    kind, spec = next(iter(query.items()))
+    if kind == 'bool':
+        return _evaluate_bool(doc, spec)
+    if kind == 'nested':
+        path = spec['path']
+        prefix = path + '.'
+        for item in doc.get(path) or []:
+            nested_doc = {prefix + key: value for key, value in item.items()}
+            matched, score, names = _evaluate(nested_doc, spec['query'])
+            if matched:
+                return True, score, names + ([spec['_name']] if '_name' in spec else [])
+        return False, 0.0, []
+    if kind == 'term':
+        field, value = next(iter(spec.items()))
+        value = value['value'] if isinstance(value, dict) else value
+        return value in _field_values(doc, field), 1.0, []
+    if kind == 'terms':
+        field, values = next(iter(spec.items()))
+        return bool(set(values) & set(_field_values(doc, field))), 1.0, []
+    if kind in ('simple_query_string', 'multi_match'):
+        score = _text_score(doc, spec['query'], spec.get('fields', []))
+        return score > 0, score, []
+    if kind == 'match':
+        field, value = next(iter(spec.items()))
+        value = value['query'] if isinstance(value, dict) else value
+        if field.endswith('.suggest'):
+            # Подполе с edge n-gram: каждое слово запроса должно быть началом какого-нибудь слова поля
+            words = ' '.join(str(x) for x in _field_values(doc, field[:-len('.suggest')])).lower().split()
+            matched = all(any(w.startswith(token) for w in words) for token in value.lower().split())
+            return matched, 1.0, []
+        score = _text_score(doc, value, [field])
+        return score > 0, score, []
+    if kind == 'prefix':
+        field, value = next(iter(spec.items()))
+        value = (value['value'] if isinstance(value, dict) else value).lower()
+        return any(str(x).lower().startswith(value) for x in _field_values(doc, field)), 1.0, []
+    raise NotImplementedError(f'query {kind} is not supported by the fake')
+
+
+def _as_list(clauses) -> List[dict]:
+    if clauses is None:
+        return []
+    return clauses if isinstance(clauses, list) else [clauses]
+
+
+def _evaluate_bool(doc: dict, spec: dict) -> Match:
+    score, names = 0.0, []
+    for clause in _as_list(spec.get('must')) + _as_list(spec.get('filter')):
+        matched, clause_score, clause_names = _evaluate(doc, clause)
+        if not matched:
+            return False, 0.0, []
+        score += clause_score
+        names += clause_names
+    for clause in _as_list(spec.get('must_not')):
+        if _evaluate(doc, clause)[0]:
+            return False, 0.0, []
+    should = _as_list(spec.get('should'))
+    if should:
+        matched_should = 0
+        for clause in should:
+            matched, clause_score, clause_names = _evaluate(doc, clause)
+            if matched:
+                matched_should += 1
+                score += clause_score
+                names += clause_names
+        required = spec.get('minimum_should_match', 0 if spec.get('must') or spec.get('filter') else 1)
+        if matched_should < required:
+            return False, 0.0, []
+    return True, score or 1.0, names
+
+
+def _sort_spec(sort) -> List[Tuple[str, str]]:
+    spec = []
+    for item in _as_list(sort):
+        if isinstance(item, str):
+            spec.append((item, 'desc' if item == '_score' else 'asc'))
+            continue
+        field, order = next(iter(item.items()))
+        spec.append((field, order['order'] if isinstance(order, dict) else order))
+    return spec
+
+
+def _compare(spec: List[Tuple[str, str]], left: list, right: list) -> int:
+    for (_, order), a, b in zip(spec, left, right):
+        if a == b:
+            continue
+        result = -1 if a < b else 1
+        return -result if order == 'desc' else result
+    return 0
+
+
+def _aggregate(rows: List[Tuple[dict, dict]], aggs: dict, path: Optional[str] = None) -> dict:
+    """
+    Агрегации nested, reverse_nested и terms. Строка — пара (документ, в котором ищутся поля;
+    корневой документ), чтобы reverse_nested мог вернуться от вложенных документов к фильмам.
+    """
+    result = {}
+    for name, spec in aggs.items():
+        sub = spec.get('aggs', {})
+        if 'nested' in spec:
+            nested_path = spec['nested']['path']
+            nested = [(item, root) for _, root in rows for item in root.get(nested_path) or []]
+            result[name] = {'doc_count': len(nested), **_aggregate(nested, sub, nested_path)}
+        elif 'reverse_nested' in spec:
+            roots = list({id(root): root for _, root in rows}.values())
+            result[name] = {'doc_count': len(roots), **_aggregate([(x, x) for x in roots], sub)}
+        elif 'terms' in spec:
+            field = spec['terms']['field']
+            if path:
+                field = field[len(path) + 1:]
+            groups: Dict[Any, list] = {}
+            for row in rows:
+                for value in _field_values(row[0], field):
+                    groups.setdefault(value, []).append(row)
+            buckets = sorted(groups.items(), key=lambda x: len(x[1]), reverse=True)[:spec['terms'].get('size', 10)]
+            result[name] = {
+                'buckets': [{'key': key, 'doc_count': len(group), **_aggregate(group, sub, path)}
+                            for key, group in buckets]
+            }
+    return result
+
+
+class FakeConnectionPool:
+    """Пул соединений транспорта без соединений: статистика пулов для заменителя пуста."""
+    connections: List = []
+
+
+class FakeTransport:
+    """Поля транспорта, которые читает статистика сервиса (db.elastic.stats)."""
+    connection_pool = FakeConnectionPool()
+
+
+class FakeElasticsearch:
+    """Индексы — словари документов из generate_catalog, запросы выполняются перебором."""
+
+    def __init__(self, catalog: Catalog, latency: float = 0.0):
+        self.indices = catalog
+        self.latency = latency
+        self.calls = 0
+        self.transport = FakeTransport()
+        # Выключенный заменитель ведёт себя как недоступный кластер
+        self.available = True
+        # (индекс, поле) -> обратный индекс; строятся при первом запросе и не меняются
+        self._inverted: Dict[Tuple[str, str], dict] = {}
+
+    async def _roundtrip(self):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if not self.available:
+            raise ElasticConnectionError('N/A', 'fake cluster is down', None)
+
+    async def ping(self) -> bool:
+        return self.available
+
+    async def get(self, index: str, id: str, **params) -> dict:
+        await self._roundtrip()
+        source = self.indices[index].get(id)
+        if source is None:
+            raise NotFoundError(404, 'not_found', {'_index': index, '_id': id, 'found': False})
+        return {'_index': index, '_id': id, '_seq_no': 1, '_primary_term': 1, 'found': True, '_source': source}
+
+    async def mget(self, body: dict, index: str, **params) -> dict:
+        await self._roundtrip()
+        docs = []
+        for doc_id in body['ids']:
+            source = self.indices[index].get(doc_id)
+            doc = {'_index': index, '_id': doc_id, 'found': source is not None}
+            if source is not None:
+                doc['_source'] = source
+            docs.append(doc)
+        return {'docs': docs}
+
+    async def search(self, index: str, body: Optional[dict] = None, size: Optional[int] = None, **params) -> dict:
+        await self._roundtrip()
+        return self._search(index, body or {}, size)
+
+    async def msearch(self, body: List[dict], index: Optional[str] = None, **params) -> dict:
+        await self._roundtrip()
+        # Тело msearch — чередование заголовков и запросов
+        responses = [
+            self._search(header.get('index', index), query, None)
+            for header, query in zip(body[::2], body[1::2])
+        ]
+        return {'took': 1, 'responses': responses}
+
+    def _postings(self, index: str, field: str) -> Dict[str, Dict[str, int]]:
+        """Обратный индекс поля: слово -> {идентификатор документа: число вхождений}."""
+        postings = self._inverted.get((index, field))
+        if postings is None:
+            postings = {}
+            for doc_id, source in self.indices[index].items():
+                text = ' '.join(str(x) for x in _field_values(source, field))
+                for token, count in Counter(text.lower().split()).items():
+                    postings.setdefault(token, {})[doc_id] = count
+            self._inverted[(index, field)] = postings
+        return postings
+
+    def _terms(self, index: str, field: str) -> Dict[Any, Set[str]]:
+        """Индекс точных значений поля, в том числе вложенного (genres.id): значение -> идентификаторы."""
+        terms = self._inverted.get((index, 'term:' + field))
+        if terms is None:
+            terms = {}
+            path, _, key = field.partition('.')
+            for doc_id, source in self.indices[index].items():
+                if field in source or not key:
+                    values = _field_values(source, field)
+                else:
+                    values = [x.get(key) for x in source.get(path) or []]
+                for value in values:
+                    terms.setdefault(value, set()).add(doc_id)
+            self._inverted[(index, 'term:' + field)] = terms
+        return terms
+
+    def _candidates(self, index: str, query: dict) -> Optional[Set[str]]:
+        """
+        Документы, которые могут подойти под запрос с точными условиями; None — перебирать все.
+        Окончательную проверку кандидатов всё равно делает _evaluate.
+        """
+        if not query:
+            return None
+        kind, spec = next(iter(query.items()))
+        if kind == 'term':
+            field, value = next(iter(spec.items()))
+            value = value['value'] if isinstance(value, dict) else value
+            return self._terms(index, field).get(value, set())
+        if kind == 'nested':
+            return self._candidates(index, spec['query'])
+        if kind == 'bool':
+            required = [self._candidates(index, x) for x in _as_list(spec.get('must')) + _as_list(spec.get('filter'))]
+            required = [x for x in required if x is not None]
+            if required:
+                return set.intersection(*required)
+            if spec.get('must') or spec.get('filter') or not spec.get('should'):
+                return None
+            should = [self._candidates(index, x) for x in _as_list(spec['should'])]
+            if any(x is None for x in should):
+                return None
+            return set.union(*should)
+        return None
+
+    def _full_text(self, index: str, spec: dict) -> List[Tuple[dict, float, List[str]]]:
+        # Полнотекстовый запрос верхнего уровня считаем по обратному индексу, а не перебором документов
+        scores: Dict[str, float] = {}
+        tokens = spec['query'].lower().split()
+        for field in spec.get('fields', []):
+            name, _, boost = field.partition('^')
+            postings = self._postings(index, name)
+            for token in tokens:
+                for doc_id, count in postings.get(token, {}).items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + float(boost or 1) * count
+        docs = self.indices[index]
+        return [(docs[doc_id], score, []) for doc_id, score in scores.items()]
+
+    def _search(self, index: str, body: dict, size: Optional[int]) -> dict:
+        started = time.perf_counter()
+        query = body.get('query', {})
+        if 'simple_query_string' in query:
+            hits = self._full_text(index, query['simple_query_string'])
+        else:
+            docs = self.indices[index]
+            candidates = self._candidates(index, query)
+            hits = []
+            for source in (docs.values() if candidates is None else (docs[x] for x in candidates)):
+                matched, score, names = _evaluate(source, query)
+                if matched:
+                    hits.append((source, score, names))
+
+        spec = _sort_spec(body.get('sort')) or [('_score', 'desc')]
+
+        def sort_values(hit) -> list:
+            source, score, _ = hit
+            return [score if field == '_score' else source.get(field) for field, _ in spec]
+
+        hits = [(hit, sort_values(hit)) for hit in hits]
+        # Устойчивая сортировка по ключам от последнего к первому даёт порядок по всему списку ключей
+        for position, (_, order) in reversed(list(enumerate(spec))):
+            hits.sort(key=lambda x: x[1][position], reverse=order == 'desc')
+        if body.get('search_after'):
+            after = body['search_after']
+            hits = [hit for hit in hits if _compare(spec, hit[1], after) > 0]
+        start = body.get('from', 0)
+        page_size = body.get('size', size if size is not None else 10)
+        source_filter = body.get('_source', True)
+
+        page = []
+        for (source, score, names), values in hits[start:start + page_size]:
+            hit = {'_index': index, '_id': source['id'], '_score': score}
+            if source_filter is True:
+                hit['_source'] = source
+            elif source_filter:
+                hit['_source'] = {key: source[key] for key in source_filter if key in source}
+            if 'sort' in body:
+                hit['sort'] = values
+            if names:
+                hit['matched_queries'] = names
+            page.append(hit)
+        response = {
+            'took': int((time.perf_counter() - started) * 1000),
+            'timed_out': False,
+            'hits': {'total': {'value': len(hits), 'relation': 'eq'}, 'hits': page},
+        }
+        if body.get('aggs'):
+            response['aggregations'] = _aggregate([(source, source) for (source, _, _), _ in hits], body['aggs'])
+        return response
+
+    async def close(self):
+        pass
+
+
+class FakePool:
+    """Поля пула aioredis, которые читает статистика сервиса."""
+    size = freesize = minsize = maxsize = 1
+
+
+class FakePipeline:
+    def __init__(self, redis: 'FakeRedis'):
+        self.redis = redis
+        self.commands = []
+
+    def set(self, key: str, value: bytes, expire: int = 0):
+        self.commands.append((self.redis.set, (key, value), {'expire': expire}))
+
+    def delete(self, key: str):
+        self.commands.append((self.redis.delete, (key,), {}))
+
+    async def execute(self) -> list:
+        await self.redis._roundtrip()
+        results = []
+        for command, args, kwargs in self.commands:
+            results.append(command(*args, **kwargs, _counted=False))
+        return [await x for x in results]
+
+
+class FakeRedis:
+    """Строковые ключи со временем жизни: get, set (с NX и PX), mget, delete, exists и пайплайн."""
+    SET_IF_NOT_EXIST = Redis.SET_IF_NOT_EXIST
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self.connection = FakePool()
+        # ключ -> (момент истечения или None, значение)
+        self._data: Dict[str, Tuple[Optional[float], bytes]] = {}
+
+    async def _roundtrip(self):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _get(self, key: str) -> Optional[bytes]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expire_at, value = item
+        if expire_at is not None and expire_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        await self._roundtrip()
+        return self._get(key)
+
+    async def mget(self, *keys: str) -> List[Optional[bytes]]:
+        await self._roundtrip()
+        return [self._get(key) for key in keys]
+
+    async def set(self, key: str, value, expire: int = 0, pexpire: int = 0, exist=None, _counted: bool = True):
+        if _counted:
+            await self._roundtrip()
+        if exist == self.SET_IF_NOT_EXIST and self._get(key) is not None:
+            return None
+        ttl = expire or pexpire / 1000
+        value = value.encode() if isinstance(value, str) else value
+        self._data[key] = (time.monotonic() + ttl if ttl else None, value)
+        return True
+
+    async def delete(self, *keys: str, _counted: bool = True) -> int:
+        if _counted:
+            await self._roundtrip()
+        return sum(self._data.pop(key, None) is not None for key in keys)
+
+    async def exists(self, key: str) -> int:
+        await self._roundtrip()
+        return int(self._get(key) is not None)
+
+    def pipeline(self) -> FakePipeline:
+        return FakePipeline(self)
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
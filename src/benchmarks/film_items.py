@@ -0,0 +1,64 @@
+"""
+Сравнивает стоимость построения объектов для страницы выдачи на 1000 хитов:
+валидируемая модель Film(**x['_source']) против облегчённого FilmItem.
+Меряется время построения и пиковый объём выделенной памяти.
+
+Запуск из каталога src: python -m benchmarks.film_items
+"""
+import timeit
+import tracemalloc
+import uuid
+
+from models.film import Film, FilmItem
+
+HITS = 1000
+REPEATS = 20
+
+
+def make_hits(count: int) -> list:
+    persons = [{'id': str(uuid.uuid4()), 'name': f'Person {i}'} for i in range(6)]
+    return [
+        {
+            '_id': str(i),
+            '_source': {
+                'id': str(uuid.uuid4()),
+                'title': f'Film {i}',
+                'description': 'Some description ' * 10,
+                'imdb_rating': 7.5,
+                'genre': ['Action', 'Drama'],
+                'genres': [{'id': str(uuid.uuid4()), 'name': 'Action'}, {'id': str(uuid.uuid4()), 'name': 'Drama'}],
+                'directors': persons[:1],
+                'writers': persons[1:2],
+                'actors': persons[2:],
+                'writers_names': [x['name'] for x in persons[1:2]],
+                'directors_names': [x['name'] for x in persons[:1]],
+                'actors_names': [x['name'] for x in persons[2:]],
+            }
+        }
+        for i in range(count)
+    ]
+
+
+def measure(name: str, build):
+    seconds = min(timeit.repeat(build, number=1, repeat=REPEATS))
+    tracemalloc.start()
+    result = build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(result) == HITS
+    print(f'{name:<40} {seconds * 1000:8.2f} ms  {peak / 1024:8.1f} KiB peak')
+
+
+def main():
+    full_hits = make_hits(HITS)
+    # Списочные запросы забирают из индекса только поля FilmItem
+    projected_hits = [{'_source': {k: x['_source'][k] for k in FilmItem.__slots__}} for x in full_hits]
+
+    print(f'per {HITS} hits:')
+    measure("Film(**x['_source']), full source", lambda: [Film(**x['_source']) for x in full_hits])
+    measure("Film(**x['_source']), projected", lambda: [Film(**x['_source']) for x in projected_hits])
+    measure('FilmItem.from_source, projected', lambda: [FilmItem.from_source(x['_source']) for x in projected_hits])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Нагрузочный прогон API без внешних сервисов: приложение вызывается напрямую как ASGI,
+Elasticsearch и Redis заменены заменителями в памяти, каталог генерируется.
+Печатает пропускную способность и перцентили задержки по сценариям.
+
+Запуск из каталога src:
+    python -m benchmarks.load --scenario mixed --requests 5000 --concurrency 50 --es-latency-ms 2
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+from benchmarks.catalog import Catalog, generate_catalog
+from benchmarks.fakes import FakeElasticsearch, FakeRedis
+from benchmarks.scenarios import SCENARIOS, Hot, Request
+from core import config
+from db import cache, elastic, redis
+from db.cache import Cache
+from db.memory import LRUCache
+from db.writer import CacheWriter
+from main import app
+from services.genre import genre_catalog
+
+
+class Report:
+    def __init__(self, scenario: str, latencies: List[float], errors: int, elapsed: float):
+        self.scenario = scenario
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.elapsed = elapsed
+
+    @property
+    def rps(self) -> float:
+        return len(self.latencies) / self.elapsed
+
+    def percentile(self, p: float) -> float:
+        """Перцентиль задержки в миллисекундах."""
+        index = min(len(self.latencies) - 1, int(len(self.latencies) * p / 100))
+        return self.latencies[index] * 1000
+
+    def row(self) -> str:
+        return (f'{self.scenario:<14} {self.rps:9.0f} {self.percentile(50):8.2f} {self.percentile(90):8.2f} '
+                f'{self.percentile(99):8.2f} {self.latencies[-1] * 1000:8.2f} {self.errors:7d}')
+
+
+REPORT_HEADER = f'{"scenario":<14} {"req/s":>9} {"p50 ms":>8} {"p90 ms":>8} {"p99 ms":>8} {"max ms":>8} {"errors":>7}'
+
+
+async def call(path: str, params: Dict[str, str]) -> int:
+    """Выполняет GET-запрос к приложению в обход сети и возвращает статус ответа."""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': urlencode(params).encode(),
+        'headers': [(b'host', b'benchmark')],
+        'client': ('127.0.0.1', 0),
+        'server': ('benchmark', 80),
+    }
+    status = 0
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await app(scope, receive, send)
+    return status
+
+
+class Environment:
+    """Подменяет клиенты Redis и Elasticsearch заменителями и поднимает кеш так же, как main.startup."""
+
+    def __init__(self, catalog: Catalog, es_latency: float = 0.0, redis_latency: float = 0.0):
+        self.catalog = catalog
+        self.es_latency = es_latency
+        self.redis_latency = redis_latency
+
+    async def __aenter__(self) -> 'Environment':
+        redis.redis = FakeRedis(self.redis_latency)
+        elastic.es = FakeElasticsearch(self.catalog, self.es_latency)
+        writer = CacheWriter(redis.redis, config.CACHE_WRITE_QUEUE_SIZE, config.CACHE_WRITE_BATCH_SIZE)
+        writer.start()
+        cache.cache = Cache(
+            redis.redis,
+            LRUCache(config.MEMORY_CACHE_MAX_BYTES, config.MEMORY_CACHE_EXPIRE_IN_SECONDS),
+            writer,
+        )
+        await genre_catalog.start(elastic.es)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await genre_catalog.stop()
+        await cache.cache.writer.stop()
+
+
+async def run_scenario(name: str, catalog: Catalog, requests: int = 2000, concurrency: int = 20,
+                       warmup: int = 200, hot_share: float = 0.1, seed: int = 0,
+                       es_latency: float = 0.0, redis_latency: float = 0.0) -> Report:
+    """
+    Прогоняет сценарий на свежем окружении: кеши пустые, прогрев не входит в замер.
+    Удобно вызывать и из CLI, и из pytest.
+    """
+    scenario = SCENARIOS[name]
+    hot = Hot(catalog, hot_share)
+    async with Environment(catalog, es_latency, redis_latency):
+        rng = random.Random(seed)
+        for _ in range(warmup):
+            await call(*scenario(rng, hot))
+
+        latencies: List[float] = []
+        errors = 0
+        remaining = requests
+
+        async def worker(worker_rng: random.Random):
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                request: Request = scenario(worker_rng, hot)
+                started = time.perf_counter()
+                status = await call(*request)
+                latencies.append(time.perf_counter() - started)
+                if status >= 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(random.Random(seed * 1000 + i + 1)) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return Report(name, latencies, errors, elapsed)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон API на заменителях Elasticsearch и Redis')
+    parser.add_argument('--scenario', choices=[*SCENARIOS, 'all'], default='all')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=200)
+    parser.add_argument('--films', type=int, default=5000)
+    parser.add_argument('--persons', type=int, default=2000)
+    parser.add_argument('--hot', type=float, default=0.1, help='доля каталога, на которую приходятся запросы')
+    parser.add_argument('--es-latency-ms', type=float, default=0.0)
+    parser.add_argument('--redis-latency-ms', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+async def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    # Время на заменителях включает ожидание в общем цикле событий, журнал медленных запросов тут только шумит
+    logging.getLogger('elastic.slow').setLevel(logging.ERROR)
+    catalog = generate_catalog(args.films, args.persons, args.seed)
+    names = list(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+    print(REPORT_HEADER)
+    for name in names:
+        report = await run_scenario(
+            name, catalog, args.requests, args.concurrency, args.warmup, args.hot, args.seed,
+            args.es_latency_ms / 1000, args.redis_latency_ms / 1000,
+        )
+        print(report.row())
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+"""
+Сравнивает CPU на одно попадание в кеш карточки фильма:
+разбор Film из JSON, перекладку в FilmDetail и сериализацию ответа
+против отдачи готовых байт тела ответа.
+
+Запуск из каталога src: python -m benchmarks.passthrough
+"""
+import timeit
+import uuid
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse, Response
+
+from api.v1.film import FilmDetail, film_detail, render_film_detail
+from models.film import Film
+
+ITERATIONS = 20000
+
+
+def make_film() -> Film:
+    persons = [{'id': str(uuid.uuid4()), 'name': f'Person {i}'} for i in range(10)]
+    return Film(
+        id=uuid.uuid4(),
+        title='Star Wars: Episode IV - A New Hope',
+        description='The Imperial Forces, under orders from cruel Darth Vader, hold Princess Leia hostage.' * 3,
+        imdb_rating=8.6,
+        genre=['Action', 'Adventure', 'Fantasy'],
+        genres=[{'id': str(uuid.uuid4()), 'name': x} for x in ('Action', 'Adventure', 'Fantasy')],
+        directors=persons[:1],
+        writers=persons[1:3],
+        actors=persons[3:],
+        writers_names=[x['name'] for x in persons[1:3]],
+        directors_names=[x['name'] for x in persons[:1]],
+        actors_names=[x['name'] for x in persons[3:]],
+    )
+
+
+def main():
+    film = make_film()
+    cached_film = film.json().encode()
+    cached_response = render_film_detail(film)
+
+    def parse_path():
+        # Так отвечала ручка до быстрого пути: разбор, перекладка, валидация по response_model, сериализация
+        detail = film_detail(Film.parse_raw(cached_film))
+        content = jsonable_encoder(FilmDetail.validate(detail))
+        return ORJSONResponse(content).body
+
+    def passthrough_path():
+        return Response(content=cached_response, media_type='application/json').body
+
+    assert orjson.loads(parse_path()) == orjson.loads(passthrough_path())
+
+    parse_time = timeit.timeit(parse_path, number=ITERATIONS) / ITERATIONS * 1e6
+    passthrough_time = timeit.timeit(passthrough_path, number=ITERATIONS) / ITERATIONS * 1e6
+    print(f'parse + serialize: {parse_time:8.2f} us/request')
+    print(f'passthrough:       {passthrough_time:8.2f} us/request')
+    print(f'saved:             {parse_time - passthrough_time:8.2f} us/request ({parse_time / passthrough_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Сценарии нагрузки: каждый по генератору случайных чисел и каталогу выбирает следующий запрос к API.
+Идентификаторы берутся из «горячего» подмножества каталога, как в живом трафике,
+где большая часть запросов приходится на немногие популярные документы.
+"""
+import random
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.catalog import Catalog, WORDS
+
+Request = Tuple[str, Dict[str, str]]
+Scenario = Callable[[random.Random, 'Hot'], Request]
+
+SORTS = ('-imdb_rating', 'imdb_rating')
+
+
+class Hot:
+    """Горячие подмножества идентификаторов по индексам."""
+
+    def __init__(self, catalog: Catalog, share: float):
+        self.ids: Dict[str, List[str]] = {
+            index: list(docs)[:max(1, int(len(docs) * share))] for index, docs in catalog.items()
+        }
+
+    def pick(self, rng: random.Random, index: str) -> str:
+        return rng.choice(self.ids[index])
+
+
+def film_detail(rng: random.Random, hot: Hot) -> Request:
+    return '/api/v1/film/<uuid:UUID>/', {'film_id': hot.pick(rng, 'movies')}
+
+
+def film_list(rng: random.Random, hot: Hot) -> Request:
+    params = {'sort': rng.choice(SORTS), 'page[size]': '50', 'page[number]': str(rng.randint(1, 5))}
+    if rng.random() < 0.5:
+        params['filter[genre]'] = hot.pick(rng, 'genres')
+    return '/api/v1/film/', params
+
+
+def film_search(rng: random.Random, hot: Hot) -> Request:
+    return '/api/v1/film/search/', {'query': ' '.join(rng.sample(WORDS, 2)), 'page[size]': '50'}
+
+
+def genre_list(rng: random.Random, hot: Hot) -> Request:
+    return '/api/v1/genre/', {}
+
+
+def genre_detail(rng: random.Random, hot: Hot) -> Request:
+    return '/api/v1/genre/<uuid:UUID>/', {'genre_id': hot.pick(rng, 'genres')}
+
+
+def genre_facets(rng: random.Random, hot: Hot) -> Request:
+    # Страница каталога без поиска встречается чаще, чем фильтр по результатам поиска
+    params = {'query': rng.choice(WORDS)} if rng.random() < 0.3 else {}
+    return '/api/v1/genre/facets/', params
+
+
+def person_detail(rng: random.Random, hot: Hot) -> Request:
+    return '/api/v1/person/<uuid:UUID>/', {'person_id': hot.pick(rng, 'persons')}
+
+
+def person_search(rng: random.Random, hot: Hot) -> Request:
+    return '/api/v1/person/search/', {'query': rng.choice(WORDS), 'page[size]': '50'}
+
+
+def suggest(rng: random.Random, hot: Hot) -> Request:
+    # Набор слова по буквам: короткие префиксы повторяются чаще длинных
+    word = rng.choice(WORDS)
+    return '/api/v1/suggest/', {'query': word[:rng.randint(1, len(word))]}
+
+
+def mixed(rng: random.Random, hot: Hot) -> Request:
+    # Примерная доля ручек в трафике: больше всего карточек фильмов и списков
+    scenario = rng.choices(
+        (film_detail, film_list, film_search, genre_list, genre_detail, person_detail, person_search),
+        weights=(40, 20, 10, 5, 5, 15, 5),
+    )[0]
+    return scenario(rng, hot)
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    'film_detail': film_detail,
+    'film_list': film_list,
+    'film_search': film_search,
+    'genre_list': genre_list,
+    'genre_detail': genre_detail,
+    'genre_facets': genre_facets,
+    'person_detail': person_detail,
+    'person_search': person_search,
+    'suggest': suggest,
+    'mixed': mixed,
+}
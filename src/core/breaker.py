@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+from core.errors import BackendUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpen(BackendUnavailable):
+    """Бэкенд признан недоступным, вызов отклонён без обращения к нему."""
+
+    def __init__(self, retry_after: int):
+        super().__init__('circuit is open', retry_after)
+
+
+class CircuitBreaker:
+    """
+    Размыкатель цепи: после нескольких отказов подряд вызовы бэкенда сразу отклоняются,
+    а доступность проверяется фоновой пробой. Как только проба проходит, цепь снова замыкается.
+    """
+
+    def __init__(self, failure_threshold: int, probe_interval: float, probe: Callable[[], Awaitable[bool]]):
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.probe = probe
+        self.failures = 0
+        self.opened = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._task is not None
+
+    def check(self):
+        if self.is_open:
+            raise CircuitOpen(int(self.probe_interval) or 1)
+
+    def success(self):
+        self.failures = 0
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold and not self.is_open:
+            logger.error('Circuit opened after %d failures in a row', self.failures)
+            self.opened += 1
+            self._task = asyncio.ensure_future(self._probe_until_healthy())
+
+    async def _probe_until_healthy(self):
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            try:
+                healthy = await self.probe()
+            except Exception as error:
+                logger.warning('Circuit probe failed: %s', error)
+                continue
+            if healthy:
+                break
+        logger.info('Circuit closed, backend is healthy again')
+        self.failures = 0
+        self._task = None
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'open': int(self.is_open),
+            'failures': self.failures,
+            'opened': self.opened,
+        }
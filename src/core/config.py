@@ -12,10 +12,113 @@ PROJECT_NAME = os.getenv('PROJECT_NAME', 'movies')
 # Настройки Redis
 REDIS_HOST = os.getenv('REDIS_HOST', '127.0.0.1')
 REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+# Пул соединений с Redis: занятые запросами соединения плюс одно под фоновую запись
+REDIS_POOL_MIN_SIZE = int(os.getenv('REDIS_POOL_MIN_SIZE', 10))
+REDIS_POOL_MAX_SIZE = int(os.getenv('REDIS_POOL_MAX_SIZE', 20))
+# Таймаут установки соединения, в секундах
+REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', 1))
+
+# Кеш в памяти процесса перед Redis
+MEMORY_CACHE_MAX_BYTES = int(os.getenv('MEMORY_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+MEMORY_CACHE_EXPIRE_IN_SECONDS = int(os.getenv('MEMORY_CACHE_EXPIRE_IN_SECONDS', 60 * 5))
+
+# Время жизни карточек в кеше. ETL сообщает об изменениях документов,
+# поэтому записи можно держать долго, не боясь отдавать устаревшие данные
+FILM_CACHE_EXPIRE_IN_SECONDS = int(os.getenv('FILM_CACHE_EXPIRE_IN_SECONDS', 60 * 60))
+GENRE_CACHE_EXPIRE_IN_SECONDS = int(os.getenv('GENRE_CACHE_EXPIRE_IN_SECONDS', 60 * 60))
+GENRE_FACETS_CACHE_EXPIRE_IN_SECONDS = int(os.getenv('GENRE_FACETS_CACHE_EXPIRE_IN_SECONDS', 60 * 60))
+# Готовый ответ по персоне вместе со списками фильмов по ролям
+PERSON_CACHE_EXPIRE_IN_SECONDS = int(os.getenv('PERSON_CACHE_EXPIRE_IN_SECONDS', 60 * 60))
+
+# max-age в Cache-Control карточек: столько клиенты и CDN могут не перепроверять ETag
+HTTP_CACHE_MAX_AGE_IN_SECONDS = int(os.getenv('HTTP_CACHE_MAX_AGE_IN_SECONDS', 60))
+
+# Подсказки при наборе: бюджет времени на ответ Elasticsearch и время жизни готовых ответов в кеше
+SUGGEST_TIMEOUT_MS = int(os.getenv('SUGGEST_TIMEOUT_MS', 100))
+SUGGEST_CACHE_EXPIRE_IN_SECONDS = int(os.getenv('SUGGEST_CACHE_EXPIRE_IN_SECONDS', 30))
+
+# Доля времени жизни записи, после которой она считается устаревшей:
+# до жёсткого истечения её ещё отдают, а свежую версию загружают в фоне
+CACHE_STALE_RATIO = float(os.getenv('CACHE_STALE_RATIO', 0.8))
+
+# Период обновления каталога жанров в памяти процесса
+GENRE_CATALOG_REFRESH_IN_SECONDS = int(os.getenv('GENRE_CATALOG_REFRESH_IN_SECONDS', 60 * 5))
+
+# Теневые копии записей кеша живут в Redis дольше основных и читаются, только когда Elasticsearch
+# недоступен: сбой поиска оборачивается устаревшими данными, а не ошибками (0 — не хранить)
+CACHE_SHADOW_EXPIRE_IN_SECONDS = int(os.getenv('CACHE_SHADOW_EXPIRE_IN_SECONDS', 60 * 60 * 24))
+
+# Канал Redis, в который ETL публикует идентификаторы переиндексированных документов
+CACHE_INVALIDATION_CHANNEL = os.getenv('CACHE_INVALIDATION_CHANNEL', 'cache_invalidation')
+
+# Очередь фоновой записи в Redis: при переполнении новые записи отбрасываются
+CACHE_WRITE_QUEUE_SIZE = int(os.getenv('CACHE_WRITE_QUEUE_SIZE', 10000))
+CACHE_WRITE_BATCH_SIZE = int(os.getenv('CACHE_WRITE_BATCH_SIZE', 100))
+
+# Записи кеша крупнее порога сжимаются zlib перед отправкой в Redis
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv('CACHE_COMPRESS_MIN_BYTES', 1024))
+CACHE_COMPRESS_LEVEL = int(os.getenv('CACHE_COMPRESS_LEVEL', 1))
+
+# Блокировка в Redis, объединяющая промахи кеша между воркерами
+CACHE_LOCK_ENABLED = os.getenv('CACHE_LOCK_ENABLED', 'false').lower() == 'true'
+CACHE_LOCK_TIMEOUT_MS = int(os.getenv('CACHE_LOCK_TIMEOUT_MS', 1000))
 
 # Настройки Elasticsearch
 ELASTIC_HOST = os.getenv('ELASTIC_HOST', '127.0.0.1')
 ELASTIC_PORT = int(os.getenv('ELASTIC_PORT', 9200))
+# Число соединений, которые клиент держит открытыми к каждому узлу
+ELASTIC_POOL_SIZE = int(os.getenv('ELASTIC_POOL_SIZE', 10))
+# Таймаут одного запроса и время жизни простаивающего keep-alive соединения, в секундах
+ELASTIC_TIMEOUT = float(os.getenv('ELASTIC_TIMEOUT', 10))
+ELASTIC_KEEPALIVE_TIMEOUT = float(os.getenv('ELASTIC_KEEPALIVE_TIMEOUT', 15))
+# Сжатие тел запросов gzip: выгодно для крупных запросов при медленной сети
+ELASTIC_HTTP_COMPRESS = os.getenv('ELASTIC_HTTP_COMPRESS', 'false').lower() == 'true'
+# Повторы запроса на другом узле: по умолчанию только при ошибке соединения
+ELASTIC_MAX_RETRIES = int(os.getenv('ELASTIC_MAX_RETRIES', 3))
+ELASTIC_RETRY_ON_TIMEOUT = os.getenv('ELASTIC_RETRY_ON_TIMEOUT', 'false').lower() == 'true'
+# Обнаружение узлов кластера: при старте, при ошибке соединения и периодически (0 — выключено)
+ELASTIC_SNIFF_ON_START = os.getenv('ELASTIC_SNIFF_ON_START', 'false').lower() == 'true'
+ELASTIC_SNIFF_ON_CONNECTION_FAIL = os.getenv('ELASTIC_SNIFF_ON_CONNECTION_FAIL', 'false').lower() == 'true'
+ELASTIC_SNIFFER_TIMEOUT = float(os.getenv('ELASTIC_SNIFFER_TIMEOUT', 0))
+# Ограничение одновременных запросов воркера к Elasticsearch. Лимит подстраивается под задержку:
+# растёт, пока ответы быстрее целевой задержки, и уменьшается, когда медленнее
+ELASTIC_LIMIT_INITIAL = int(os.getenv('ELASTIC_LIMIT_INITIAL', 20))
+ELASTIC_LIMIT_MIN = int(os.getenv('ELASTIC_LIMIT_MIN', 2))
+ELASTIC_LIMIT_MAX = int(os.getenv('ELASTIC_LIMIT_MAX', 200))
+ELASTIC_LIMIT_LATENCY_TARGET_MS = int(os.getenv('ELASTIC_LIMIT_LATENCY_TARGET_MS', 250))
+# Сверх лимита запросы ждут в очереди не дольше таймаута, затем получают 503 с Retry-After
+ELASTIC_QUEUE_SIZE = int(os.getenv('ELASTIC_QUEUE_SIZE', 100))
+ELASTIC_QUEUE_TIMEOUT_MS = int(os.getenv('ELASTIC_QUEUE_TIMEOUT_MS', 500))
+ELASTIC_RETRY_AFTER_SECONDS = int(os.getenv('ELASTIC_RETRY_AFTER_SECONDS', 1))
+
+# После стольких ошибок соединения подряд цепь размыкается: запросы к Elasticsearch сразу отклоняются,
+# а его доступность проверяется фоновой пробой с заданным периодом
+ELASTIC_BREAKER_FAILURES = int(os.getenv('ELASTIC_BREAKER_FAILURES', 5))
+ELASTIC_BREAKER_PROBE_INTERVAL_SECONDS = float(os.getenv('ELASTIC_BREAKER_PROBE_INTERVAL_SECONDS', 5))
+
+# Запросы к Elasticsearch дольше порога пишутся в журнал медленных запросов вместе с телом, в миллисекундах
+ELASTIC_SLOW_QUERY_MS = int(os.getenv('ELASTIC_SLOW_QUERY_MS', 500))
+# Разрешает запросить профиль Elasticsearch для отдельного запроса заголовком X-Debug-Profile
+ELASTIC_PROFILE_ENABLED = os.getenv('ELASTIC_PROFILE_ENABLED', 'false').lower() == 'true'
+
+# Запуск в продакшене (server.py): несколько воркеров на одном сокете. Цикл событий и протокол HTTP
+# по умолчанию выбираются автоматически: uvloop и httptools, если они установлены
+SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.getenv('SERVER_PORT', 8000))
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', os.cpu_count() or 1))
+SERVER_LOOP = os.getenv('SERVER_LOOP', 'auto')
+SERVER_HTTP = os.getenv('SERVER_HTTP', 'auto')
+SERVER_BACKLOG = int(os.getenv('SERVER_BACKLOG', 2048))
+SERVER_KEEP_ALIVE_SECONDS = int(os.getenv('SERVER_KEEP_ALIVE_SECONDS', 5))
+# Плавная остановка: сколько воркер после сигнала ещё принимает запросы, уже отвечая «не готов»,
+# чтобы балансировщик успел убрать его из ротации, и сколько затем ждёт запросы в обработке
+SERVER_DRAIN_SECONDS = float(os.getenv('SERVER_DRAIN_SECONDS', 5))
+SERVER_GRACEFUL_TIMEOUT_SECONDS = float(os.getenv('SERVER_GRACEFUL_TIMEOUT_SECONDS', 30))
+
+# Прогрев воркера перед приёмом запросов: открытие пулов и заполнение кеша процесса популярными ответами
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+WARMUP_TIMEOUT_SECONDS = float(os.getenv('WARMUP_TIMEOUT_SECONDS', 30))
+WARMUP_CONCURRENCY = int(os.getenv('WARMUP_CONCURRENCY', 10))
 
 # Корень проекта
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
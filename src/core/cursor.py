@@ -0,0 +1,29 @@
+import base64
+from typing import Optional
+
+import orjson
+
+
+class InvalidCursor(ValueError):
+    """Курсор испорчен или выдан для другой сортировки: клиенту отвечаем 400."""
+
+
+def encode_cursor(search_after: list) -> str:
+    """Упаковывает значения сортировки последнего документа в непрозрачный курсор."""
+    return base64.urlsafe_b64encode(orjson.dumps(search_after)).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Optional[list]:
+    """
+    Распаковывает курсор. Пустой курсор означает первую страницу.
+    Для испорченного курсора выбрасывает InvalidCursor.
+    """
+    if not cursor:
+        return None
+    try:
+        search_after = orjson.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor('invalid cursor') from exc
+    if not isinstance(search_after, list):
+        raise InvalidCursor('invalid cursor')
+    return search_after
@@ -0,0 +1,6 @@
+class BackendUnavailable(Exception):
+    """Бэкенд сейчас не может обслужить запрос: отвечаем 503 с Retry-After, а не ждём таймаута."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
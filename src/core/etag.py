@@ -0,0 +1,18 @@
+import hashlib
+from typing import Tuple
+
+# Сильный ETag — 16 байт blake2b от тела ответа в шестнадцатеричном виде, в кавычках
+ETAG_LENGTH = 34
+
+
+def make_etag(body: bytes) -> bytes:
+    return b'"' + hashlib.blake2b(body, digest_size=16).hexdigest().encode() + b'"'
+
+
+def tag(body: bytes) -> bytes:
+    """Запись для кеша: ETag и тело ответа подряд, чтобы отвечать на условный запрос без разбора тела."""
+    return make_etag(body) + body
+
+
+def untag(record: bytes) -> Tuple[str, bytes]:
+    return record[:ETAG_LENGTH].decode(), record[ETAG_LENGTH:]
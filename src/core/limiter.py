@@ -0,0 +1,106 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+
+from core.errors import BackendUnavailable
+
+
+class Overloaded(BackendUnavailable):
+    """Запрос не дождался свободного места у бэкенда."""
+
+    def __init__(self, retry_after: int):
+        super().__init__('backend is overloaded', retry_after)
+
+
+class AdaptiveLimiter:
+    """
+    Ограничитель одновременных вызовов бэкенда с лимитом по AIMD: пока вызовы укладываются
+    в целевую задержку, лимит растёт на единицу за «окно» вызовов, а при превышении или таймауте
+    умножается на коэффициент меньше единицы. Сверх лимита запросы ждут в ограниченной очереди
+    не дольше дедлайна, остальные сразу получают отказ.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, latency_target: float,
+                 queue_size: int, queue_timeout: float, retry_after: int, backoff: float = 0.9):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.backoff = backoff
+        self.in_flight = 0
+        self.rejected = 0
+        self._last_decrease = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            raise Overloaded(self.retry_after)
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self.rejected += 1
+            raise Overloaded(self.retry_after)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+    def _abandon(self, waiter: asyncio.Future):
+        if waiter.done():
+            # Место уже передано этому ожидающему — возвращаем его следующему
+            self._release_slot()
+        else:
+            waiter.cancel()
+            self._waiters.remove(waiter)
+
+    def release(self, latency: float, overloaded: bool):
+        now = time.monotonic()
+        if overloaded or latency > self.latency_target:
+            # Уменьшаем не чаще раза за целевую задержку, иначе пачка медленных ответов обнулит лимит
+            if now - self._last_decrease > self.latency_target:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._release_slot()
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, *overload_errors: type):
+        """Занимает место на время вызова; исключения из overload_errors считаются признаком перегрузки."""
+        await self.acquire()
+        started = time.monotonic()
+        overloaded = False
+        try:
+            yield
+        except overload_errors:
+            overloaded = True
+            raise
+        finally:
+            self.release(time.monotonic() - started, overloaded)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'limit': int(self.limit),
+            'in_flight': self.in_flight,
+            'queued': len(self._waiters),
+            'rejected': self.rejected,
+        }
@@ -0,0 +1,177 @@
+"""
+Метрики процесса в текстовом формате Prometheus.
+Счётчики живут в памяти воркера, каждый воркер отдаёт свои значения на /metrics.
+Все ряды помечены меткой worker с pid процесса: воркеры делят один сокет, и без неё значения
+разных воркеров при очередных опросах выглядели бы как сбросы одного счётчика.
+Суммировать по воркерам нужно в запросах Prometheus, например sum without (worker) (rate(...)).
+"""
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Iterator
+
+from starlette.routing import Match
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names: Tuple[str, ...], values: LabelValues, extra: str = '') -> str:
+    pairs = [f'worker="{os.getpid()}"', *(f'{name}="{value}"' for name, value in zip(names, values))]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}'
+
+
+class Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        registry.append(self)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}', *self.samples()]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self.values.items():
+            yield f'{self.name}{_labels(self.label_names, labels)} {value}'
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float):
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        # метки -> (число наблюдений по корзинам, сумма)
+        self.values: Dict[LabelValues, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        counts, total = self.values.get(labels) or ([0] * (len(self.buckets) + 1), 0.0)
+        # Последняя корзина — +Inf; накопительные суммы считаются только при выводе
+        counts[bisect_left(self.buckets, value)] += 1
+        self.values[labels] = counts, total + value
+
+    @contextmanager
+    def time(self, *labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self) -> Iterator[str]:
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f'{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.label_names, labels)} {total}'
+            yield f'{self.name}_count{_labels(self.label_names, labels)} {cumulative}'
+
+
+registry: List[Metric] = []
+
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Время обработки запроса', ('method', 'route', 'status'))
+HTTP_REQUESTS_IN_FLIGHT = Gauge('http_requests_in_flight', 'Запросы в обработке')
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Обращения к кешу по пространству ключей и результату', ('keyspace', 'result'))
+BACKEND_DURATION = Histogram(
+    'backend_request_duration_seconds', 'Время вызова Redis и Elasticsearch', ('backend', 'operation'))
+BACKEND_REQUESTS_IN_FLIGHT = Gauge('backend_requests_in_flight', 'Вызовы Redis и Elasticsearch в работе', ('backend',))
+POOL_CONNECTIONS = Gauge('pool_connections', 'Соединения в пулах клиентов', ('backend', 'node', 'state'))
+CACHE_STATE = Gauge('cache_state', 'Состояние кеша в памяти и очереди записи', ('component', 'field'))
+ELASTIC_BREAKER = Gauge('elastic_breaker', 'Состояние размыкателя цепи Elasticsearch', ('field',))
+ELASTIC_LIMITER = Gauge('elastic_limiter', 'Лимит, занятые места, очередь и отказы допуска к Elasticsearch', ('field',))
+
+
+@contextmanager
+def backend_call(backend: str, operation: str):
+    """Замеряет вызов внешнего хранилища и учитывает его в числе вызовов в работе."""
+    BACKEND_REQUESTS_IN_FLIGHT.inc(backend)
+    try:
+        with BACKEND_DURATION.time(backend, operation):
+            yield
+    finally:
+        BACKEND_REQUESTS_IN_FLIGHT.dec(backend)
+
+
+def route_template(scope: Scope) -> str:
+    # В метках держим шаблон маршрута, а не сам путь, иначе число рядов метрик не ограничено
+    for route in scope['app'].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return 'unmatched'
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware, которое замеряет время ответа по маршрутам.
+    Работает на уровне ASGI, поэтому не буферизует и не оборачивает тело ответа.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - started, scope['method'], route_template(scope), str(int(status)))
@@ -0,0 +1,32 @@
+from contextvars import ContextVar
+
+from starlette.types import ASGIApp, Scope, Receive, Send
+
+from core import config
+
+PROFILE_HEADER = b'x-debug-profile'
+
+# Включён ли профиль Elasticsearch для текущего запроса. Фоновые загрузки наследуют значение
+# от запроса, который их запустил
+profile_requested: ContextVar[bool] = ContextVar('profile_requested', default=False)
+
+
+class ProfileMiddleware:
+    """
+    Включает профилирование запросов к Elasticsearch для запроса с заголовком X-Debug-Profile: 1.
+    Профиль дорог для кластера, поэтому заголовок учитывается только при ELASTIC_PROFILE_ENABLED.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] == 'http' and config.ELASTIC_PROFILE_ENABLED:
+            if dict(scope['headers']).get(PROFILE_HEADER) in (b'1', b'true'):
+                token = profile_requested.set(True)
+                try:
+                    await self.app(scope, receive, send)
+                finally:
+                    profile_requested.reset(token)
+                return
+        await self.app(scope, receive, send)
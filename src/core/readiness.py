@@ -0,0 +1,16 @@
+class Readiness:
+    """
+    Готовность воркера принимать трафик: после прогрева и до начала остановки.
+    Балансировщик опрашивает её, чтобы не направлять запросы в холодный или останавливающийся воркер.
+    """
+
+    def __init__(self):
+        self.warmed = False
+        self.draining = False
+
+    @property
+    def ready(self) -> bool:
+        return self.warmed and not self.draining
+
+
+readiness = Readiness()
@@ -0,0 +1,26 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from core.profiling import profile_requested
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные одинаковые загрузки в пределах процесса:
+    первая корутина запускает загрузку, остальные ждут её результата.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        if profile_requested.get():
+            # Профилируемый запрос загружает сам: чужая загрузка шла бы без профиля
+            return await func()
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        # shield не даёт отмене одного запроса прервать загрузку для остальных
+        return await asyncio.shield(task)
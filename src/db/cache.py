@@ -0,0 +1,266 @@
+import asyncio
+import logging
+import struct
+import time
+from typing import Optional, Dict, Any, List, Callable, Awaitable, Tuple, Set
+
+from aioredis import Redis
+
+from core import config
+from core.metrics import CACHE_REQUESTS, backend_call
+from core.profiling import profile_requested
+from db import codec
+from db.memory import LRUCache, Value
+from db.writer import CacheWriter
+
+logger = logging.getLogger(__name__)
+
+LOCK_POLL_INTERVAL_IN_SECONDS = 0.02
+
+# Версия схемы значений входит в каждый ключ: после её смены старые записи
+# просто перестают читаться и истекают по TTL
+CACHE_SCHEMA_VERSION = 3
+
+# Под ключом с этим суффиксом лежит готовое тело HTTP-ответа по документу вместе с его ETag
+RESPONSE_KEY_SUFFIX = ':response'
+
+# Префикс теневой копии записи, которая читается только при недоступном Elasticsearch
+SHADOW_PREFIX = 'shadow:'
+
+# Перед значением хранятся флаги кодека, момент мягкого истечения, после которого запись ещё отдаётся,
+# но считается устаревшей и обновляется в фоне, и момент жёсткого истечения — тот же, что у TTL ключа в Redis.
+# По нему запись, поднятая из Redis в память процесса, живёт там не дольше, чем в Redis
+HEADER = struct.Struct('!Bdd')
+
+
+# Параметры с текстом поискового запроса: анализатор Elasticsearch приводит их к нижнему регистру,
+# поэтому регистр и лишние пробелы не должны давать разные ключи. Остальные параметры (идентификаторы,
+# поле сортировки) регистрозависимы и входят в ключ как есть
+TEXT_PARAMS = {'query'}
+
+
+def _normalize(name: str, value: Any) -> str:
+    if name in TEXT_PARAMS and isinstance(value, str):
+        return ' '.join(value.lower().split())
+    return str(value)
+
+
+def make_key(prefix: str, **params: Any) -> str:
+    """
+    Строит канонический ключ кеша из параметров запроса:
+    параметры сортируются по имени, пустые отбрасываются, текст запроса нормализуется.
+    """
+    parts = [f'{name}={_normalize(name, value)}' for name, value in sorted(params.items()) if value is not None]
+    return f'{prefix}:v{CACHE_SCHEMA_VERSION}:' + '&'.join(parts)
+
+
+def entity_key(entity: str, doc_id: str) -> str:
+    """Ключ документа: фильмы, жанры и персоны не делят одно пространство ключей."""
+    return f'{entity}:v{CACHE_SCHEMA_VERSION}:{doc_id}'
+
+
+def keyspace(key: str) -> str:
+    """Пространство ключей для метрик: префикс без версии и параметров, например film:search."""
+    prefix = key.split(f':v{CACHE_SCHEMA_VERSION}:', 1)[0]
+    return prefix + RESPONSE_KEY_SUFFIX if key.endswith(RESPONSE_KEY_SUFFIX) else prefix
+
+
+def _pack(value: Value, expire: int) -> Tuple[bytes, bytes]:
+    """
+    Упаковывает значение с заголовком. Возвращает запись для памяти процесса, которая хранится несжатой,
+    и запись для Redis, которая сжимается, если она крупнее порога.
+    """
+    if isinstance(value, str):
+        value = value.encode()
+    now = time.time()
+    stale_at = now + expire * config.CACHE_STALE_RATIO
+    expire_at = now + expire
+    flags, stored = codec.compress(value)
+    return HEADER.pack(0, stale_at, expire_at) + value, HEADER.pack(flags, stale_at, expire_at) + stored
+
+
+def _unpack(data: bytes) -> Tuple[float, bytes]:
+    flags, stale_at, _ = HEADER.unpack_from(data)
+    return stale_at, codec.decompress(flags, data[HEADER.size:])
+
+
+def _inflate(data: bytes) -> bytes:
+    """Переводит запись из Redis в несжатый вид для памяти процесса."""
+    flags, stale_at, expire_at = HEADER.unpack_from(data)
+    if not flags:
+        return data
+    return HEADER.pack(0, stale_at, expire_at) + codec.decompress(flags, data[HEADER.size:])
+
+
+def _remaining(data: bytes) -> float:
+    """Сколько секунд записи осталось жить в Redis."""
+    return HEADER.unpack_from(data)[2] - time.time()
+
+
+class Cache:
+    """
+    Двухуровневый кеш: сначала память процесса, затем Redis.
+    Значение, найденное в Redis, поднимается в память процесса.
+    Запись в память процесса мгновенная, а в Redis уходит через фоновую очередь.
+    Запрос с профилем Elasticsearch (X-Debug-Profile) кеш не читает и не пишет: иначе профилировать
+    было бы нечего, а профиль не должен влиять на выдачу остальным.
+    """
+
+    def __init__(self, redis: Redis, memory: LRUCache, writer: CacheWriter):
+        self.redis = redis
+        self.memory = memory
+        self.writer = writer
+        self._refreshing: Set[str] = set()
+
+    async def get(self, key: str, refresh: Optional[Callable[[], Awaitable[Any]]] = None) -> Optional[bytes]:
+        """
+        Возвращает значение по ключу. Если запись устарела, но ещё не истекла, она отдаётся сразу,
+        а переданная функция refresh запускается в фоне, чтобы обновить кеш.
+        """
+        if profile_requested.get():
+            return None
+        space = keyspace(key)
+        data = self.memory.get(key)
+        if data is None:
+            # https://redis.io/commands/get
+            with backend_call('redis', 'get'):
+                data = await self.redis.get(key)
+            if not data:
+                CACHE_REQUESTS.inc(space, 'miss')
+                return None
+            CACHE_REQUESTS.inc(space, 'redis')
+            data = _inflate(data)
+            self.memory.set(key, data, _remaining(data))
+        else:
+            CACHE_REQUESTS.inc(space, 'memory')
+        stale_at, value = _unpack(data)
+        if refresh is not None and stale_at <= time.time():
+            CACHE_REQUESTS.inc(space, 'stale')
+            self._revalidate(key, refresh)
+        return value
+
+    async def set(self, key: str, value: Value, expire: int, shadow: bool = False):
+        """
+        shadow=True дополнительно сохраняет теневую копию для get_shadow. Это вторая запись в Redis,
+        поэтому её включают только те места, которые читают копию при недоступном Elasticsearch.
+        """
+        if profile_requested.get():
+            return
+        data, stored = _pack(value, expire)
+        self.memory.set(key, data, expire)
+        # https://redis.io/commands/set — уходит в Redis пайплайном вне пути запроса
+        self.writer.set(key, stored, expire)
+        if shadow:
+            self._set_shadow(key, stored, expire)
+
+    def _set_shadow(self, key: str, stored: bytes, expire: int):
+        # Теневая копия хранится только в Redis: в памяти процесса она лишь вытесняла бы живые записи
+        if config.CACHE_SHADOW_EXPIRE_IN_SECONDS:
+            self.writer.set(SHADOW_PREFIX + key, stored, max(expire, config.CACHE_SHADOW_EXPIRE_IN_SECONDS))
+
+    async def get_shadow(self, key: str) -> Optional[bytes]:
+        """Последнее записанное значение без учёта его возраста — для работы при недоступном Elasticsearch."""
+        with backend_call('redis', 'get'):
+            data = await self.redis.get(SHADOW_PREFIX + key)
+        CACHE_REQUESTS.inc(keyspace(key), 'shadow' if data else 'shadow_miss')
+        if not data:
+            return None
+        return _unpack(data)[1]
+
+    async def get_shadow_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        with backend_call('redis', 'mget'):
+            data = await self.redis.mget(*[SHADOW_PREFIX + key for key in keys])
+        for key, value in zip(keys, data):
+            CACHE_REQUESTS.inc(keyspace(key), 'shadow' if value else 'shadow_miss')
+        return [_unpack(value)[1] if value else None for value in data]
+
+    def _revalidate(self, key: str, refresh: Callable[[], Awaitable[Any]]):
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        asyncio.ensure_future(self._refresh(key, refresh))
+
+    async def _refresh(self, key: str, refresh: Callable[[], Awaitable[Any]]):
+        try:
+            await refresh()
+        except Exception:
+            # Ошибка фонового обновления не должна теряться молча: запрос уже получил устаревшие данные
+            logger.exception('Background refresh of %s failed', key)
+        finally:
+            self._refreshing.discard(key)
+
+    async def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        if profile_requested.get():
+            return [None] * len(keys)
+        values = [self.memory.get(key) for key in keys]
+        missing = [i for i, value in enumerate(values) if value is None]
+        # Результаты учитываются с теми же метками, что и в get: memory, redis, miss
+        results = ['miss' if value is None else 'memory' for value in values]
+        if missing:
+            # Всё, чего нет в памяти процесса, забираем из Redis одной командой
+            # https://redis.io/commands/mget
+            with backend_call('redis', 'mget'):
+                data = await self.redis.mget(*[keys[i] for i in missing])
+            for i, value in zip(missing, data):
+                if value:
+                    values[i] = _inflate(value)
+                    self.memory.set(keys[i], values[i], _remaining(values[i]))
+                    results[i] = 'redis'
+        for key, result in zip(keys, results):
+            CACHE_REQUESTS.inc(keyspace(key), result)
+        return [_unpack(value)[1] if value is not None else None for value in values]
+
+    async def set_many(self, items: Dict[str, Value], expire: int, shadow: bool = False):
+        if profile_requested.get():
+            return
+        for key, value in items.items():
+            data, stored = _pack(value, expire)
+            self.memory.set(key, data, expire)
+            self.writer.set(key, stored, expire)
+            if shadow:
+                self._set_shadow(key, stored, expire)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self.memory.delete(key)
+        # Через очередь записи: удаление не обгонит запись старого значения, поставленную раньше
+        await self.writer.evict(*keys)
+
+    async def lock(self, key: str) -> bool:
+        """
+        Захватывает короткую блокировку на загрузку ключа, чтобы за данными в Elasticsearch
+        ходил только один воркер. Если блокировки выключены, захват всегда успешен.
+        """
+        if not config.CACHE_LOCK_ENABLED:
+            return True
+        # https://redis.io/commands/set — SET NX PX
+        with backend_call('redis', 'lock'):
+            locked = await self.redis.set('lock:' + key, b'1', pexpire=config.CACHE_LOCK_TIMEOUT_MS,
+                                          exist=Redis.SET_IF_NOT_EXIST)
+        return bool(locked)
+
+    async def unlock(self, key: str):
+        if config.CACHE_LOCK_ENABLED:
+            # Снятие блокировки идёт в той же очереди после записи значения,
+            # поэтому ожидающий воркер увидит уже заполненный кеш
+            self.writer.delete('lock:' + key)
+
+    async def wait_unlock(self, key: str):
+        """Ждёт, пока другой воркер снимет блокировку, но не дольше её времени жизни."""
+        deadline = time.monotonic() + config.CACHE_LOCK_TIMEOUT_MS / 1000
+        while time.monotonic() < deadline and await self.redis.exists('lock:' + key):
+            await asyncio.sleep(LOCK_POLL_INTERVAL_IN_SECONDS)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            'memory': self.memory.stats(),
+            'writer': self.writer.stats(),
+        }
+
+
+cache: Optional[Cache] = None
+
+
+# Функция понадобится при внедрении зависимостей
+async def get_cache() -> Cache:
+    return cache
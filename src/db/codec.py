@@ -0,0 +1,42 @@
+import zlib
+from datetime import date
+from typing import Any, Tuple
+from uuid import UUID
+
+import msgpack
+
+from core import config
+
+# Флаги кодека в заголовке записи кеша
+FLAG_ZLIB = 1
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (UUID, date)):
+        return str(value)
+    raise TypeError(f'Cannot serialize {type(value)}')
+
+
+def dumps(value: Any) -> bytes:
+    # msgpack заметно компактнее json и быстрее разбирается
+    return msgpack.packb(value, default=_default, use_bin_type=True)
+
+
+def loads(data: bytes) -> Any:
+    return msgpack.unpackb(data, raw=False)
+
+
+def compress(data: bytes) -> Tuple[int, bytes]:
+    """Сжимает крупные записи. Возвращает флаги кодека и байты для хранения."""
+    if len(data) < config.CACHE_COMPRESS_MIN_BYTES:
+        return 0, data
+    compressed = zlib.compress(data, config.CACHE_COMPRESS_LEVEL)
+    if len(compressed) >= len(data):
+        return 0, data
+    return FLAG_ZLIB, compressed
+
+
+def decompress(flags: int, data: bytes) -> bytes:
+    if flags & FLAG_ZLIB:
+        return zlib.decompress(data)
+    return data
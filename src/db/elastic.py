@@ -1,8 +1,197 @@
-from typing import Optional
-from elasticsearch import AsyncElasticsearch
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List, Tuple
+
+import aiohttp
+import orjson
+from elasticsearch import AsyncElasticsearch, AIOHttpConnection, ConnectionTimeout, RequestError
+from elasticsearch import ConnectionError as ElasticConnectionError
+from elasticsearch._async.http_aiohttp import ESClientResponse
+
+from core import config
+from core.breaker import CircuitBreaker
+from core.cursor import InvalidCursor
+from core.errors import BackendUnavailable
+from core.limiter import AdaptiveLimiter
+from core.metrics import backend_call
+from core.profiling import profile_requested
+
+# Отдельный логгер, чтобы журнал медленных запросов можно было направить в свой обработчик
+slow_logger = logging.getLogger('elastic.slow')
 
 es: Optional[AsyncElasticsearch] = None
 
+# Допуск запросов сервисов к Elasticsearch, свой в каждом воркере
+limiter = AdaptiveLimiter(
+    initial=config.ELASTIC_LIMIT_INITIAL,
+    min_limit=config.ELASTIC_LIMIT_MIN,
+    max_limit=config.ELASTIC_LIMIT_MAX,
+    latency_target=config.ELASTIC_LIMIT_LATENCY_TARGET_MS / 1000,
+    queue_size=config.ELASTIC_QUEUE_SIZE,
+    queue_timeout=config.ELASTIC_QUEUE_TIMEOUT_MS / 1000,
+    retry_after=config.ELASTIC_RETRY_AFTER_SECONDS,
+)
+
+# Размыкатель цепи: пока Elasticsearch недоступен, запросы к нему не ждут таймаута соединения
+breaker = CircuitBreaker(
+    failure_threshold=config.ELASTIC_BREAKER_FAILURES,
+    probe_interval=config.ELASTIC_BREAKER_PROBE_INTERVAL_SECONDS,
+    probe=lambda: es.ping(),
+)
+
+# Ошибки, при которых Elasticsearch считается недоступным: сервисы в этом случае отдают теневые копии из кеша
+UNAVAILABLE_ERRORS = (BackendUnavailable, ElasticConnectionError)
+
+
+def _operation(method: str, url: str) -> str:
+    """Операция для метрик по адресу запроса: /movies/_search -> search, /movies/_doc/<id> -> get."""
+    for part in reversed(url.split('?', 1)[0].split('/')):
+        if part.startswith('_'):
+            return 'get' if part == '_doc' and method == 'GET' else part.lstrip('_')
+    return method.lower()
+
+
+class ElasticConnection(AIOHttpConnection):
+    """
+    Соединение с узлом Elasticsearch с настраиваемым временем жизни keep-alive.
+    Стандартное соединение не даёт передать параметры в пул aiohttp, поэтому сессия создаётся здесь.
+    """
+
+    def __init__(self, *args, keepalive_timeout: float = 15, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.keepalive_timeout = keepalive_timeout
+
+    async def _create_aiohttp_session(self):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            auto_decompress=True,
+            loop=self.loop,
+            cookie_jar=aiohttp.DummyCookieJar(),
+            response_class=ESClientResponse,
+            connector=aiohttp.TCPConnector(
+                limit=self._limit, use_dns_cache=True, ssl=self._ssl_context,
+                keepalive_timeout=self.keepalive_timeout,
+            ),
+        )
+
+    async def perform_request(self, method, url, *args, **kwargs):
+        with backend_call('elastic', _operation(method, url)):
+            return await super().perform_request(method, url, *args, **kwargs)
+
+    def stats(self) -> Dict[str, int]:
+        if self.session is None:
+            return {'limit': self._limit, 'in_use': 0, 'idle': 0}
+        connector = self.session.connector
+        return {
+            'limit': connector.limit,
+            # У aiohttp нет публичных счётчиков, поэтому смотрим на внутренние множества пула
+            'in_use': len(connector._acquired),
+            'idle': sum(len(x) for x in connector._conns.values()),
+        }
+
+
 # Функция понадобится при внедрении зависимостей
 async def get_elastic() -> AsyncElasticsearch:
     return es
+
+
+@asynccontextmanager
+async def _guarded():
+    breaker.check()
+    async with limiter.slot(ConnectionTimeout):
+        try:
+            yield
+        except ElasticConnectionError:
+            breaker.failure()
+            raise
+    breaker.success()
+
+
+def _log_query(operation: str, index: str, query: Any, elapsed_ms: float, doc: dict, profile: bool):
+    # took — время выполнения в самом Elasticsearch; разница с временем на клиенте — это сеть, очередь пула
+    # и разбор ответа. Ответ на get поля took не содержит
+    took = doc.get('took', '-')
+    query = orjson.dumps(query).decode()
+    if profile:
+        slow_logger.info('%s %s took=%sms wall=%.1fms query=%s profile=%s', operation, index, took, elapsed_ms,
+                         query, orjson.dumps(doc.get('profile')).decode())
+    else:
+        slow_logger.warning('%s %s took=%sms wall=%.1fms query=%s', operation, index, took, elapsed_ms, query)
+
+
+async def search(elastic: AsyncElasticsearch, index: str, body: Optional[dict] = None, **params) -> dict:
+    """
+    Поиск с журналом медленных запросов: тело запроса дольше ELASTIC_SLOW_QUERY_MS попадает в журнал.
+    Если для запроса включено профилирование, в тело добавляется profile и профиль пишется в журнал.
+    """
+    profile = profile_requested.get()
+    if profile:
+        body = dict(body or {}, profile=True)
+    started = time.perf_counter()
+    async with _guarded():
+        doc = await elastic.search(index=index, body=body, **params)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if profile or elapsed_ms >= config.ELASTIC_SLOW_QUERY_MS:
+        _log_query('search', index, body if body is not None else params, elapsed_ms, doc, profile)
+    return doc
+
+
+async def search_after(elastic: AsyncElasticsearch, index: str, body: dict, after: Optional[list]) -> dict:
+    """
+    Страница выдачи после значений сортировки из курсора. Курсор другой длины, чем сортировка,
+    или с неподходящими значениями (например, выданный для другой сортировки) — ошибка клиента, а не 500.
+    """
+    if after:
+        if len(after) != len(body['sort']):
+            raise InvalidCursor('cursor does not match sort')
+        body['search_after'] = after
+    try:
+        return await search(elastic, index, body=body)
+    except RequestError as error:
+        if after:
+            raise InvalidCursor('cursor does not match sort') from error
+        raise
+
+
+async def get_document(elastic: AsyncElasticsearch, index: str, doc_id: str) -> dict:
+    """Чтение документа по идентификатору с журналом медленных запросов."""
+    started = time.perf_counter()
+    async with _guarded():
+        doc = await elastic.get(index, doc_id)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms >= config.ELASTIC_SLOW_QUERY_MS:
+        _log_query('get', index, doc_id, elapsed_ms, doc, False)
+    return doc
+
+
+async def get_documents(elastic: AsyncElasticsearch, index: str, doc_ids: List[str]) -> dict:
+    """Чтение нескольких документов одним _mget."""
+    async with _guarded():
+        return await elastic.mget(body={'ids': doc_ids}, index=index)
+
+
+async def multi_search(elastic: AsyncElasticsearch, searches: List[Tuple[str, dict]]) -> dict:
+    """Несколько поисков по разным индексам за один проход через _msearch."""
+    body = []
+    for index, query in searches:
+        body.extend([{'index': index}, query])
+    started = time.perf_counter()
+    async with _guarded():
+        doc = await elastic.msearch(body=body)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms >= config.ELASTIC_SLOW_QUERY_MS:
+        _log_query('msearch', ','.join(x for x, _ in searches), body, elapsed_ms, doc, False)
+    return doc
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """Загрузка пулов соединений по каждому узлу кластера."""
+    return {
+        connection.host: connection.stats()
+        for connection in es.transport.connection_pool.connections
+        if isinstance(connection, ElasticConnection)
+    }
@@ -0,0 +1,68 @@
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Tuple, Union
+
+Value = Union[str, bytes]
+
+
+class LRUCache:
+    """
+    Кеш в памяти процесса (L1) с вытеснением по LRU и временем жизни записей.
+    Объём ограничен бюджетом в байтах: размер записи считается по длине сериализованного значения.
+    """
+
+    def __init__(self, max_bytes: int, expire: float):
+        self.max_bytes = max_bytes
+        self.expire = expire
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # ключ -> (момент истечения, значение)
+        self._data: 'OrderedDict[str, Tuple[float, Value]]' = OrderedDict()
+
+    def get(self, key: str) -> Optional[Value]:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expire_at, value = item
+        if expire_at <= time.monotonic():
+            self.delete(key)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Value, expire: Optional[float] = None):
+        # Запись не может жить в памяти дольше, чем в Redis: при записи передаётся её TTL,
+        # а при подъёме из Redis — оставшееся там время
+        expire = self.expire if expire is None else min(expire, self.expire)
+        size = len(value)
+        if expire <= 0 or size > self.max_bytes:
+            return
+        self.delete(key)
+        self._data[key] = (time.monotonic() + expire, value)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self._data.popitem(last=False)
+            self.size -= len(evicted)
+
+    def delete(self, key: str):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.size -= len(item[1])
+
+    def clear(self):
+        self._data.clear()
+        self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'items': len(self._data),
+            'size': self.size,
+            'max_bytes': self.max_bytes,
+        }
+
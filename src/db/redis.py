@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Optional, Dict
 from aioredis import Redis
 
 redis: Optional[Redis] = None
@@ -7,3 +7,14 @@ redis: Optional[Redis] = None
 # Функция понадобится при внедрении зависимостей
 async def get_redis() -> Redis:
     return redis
+
+
+def stats() -> Dict[str, int]:
+    """Загрузка пула соединений: сколько открыто и сколько из них свободно."""
+    pool = redis.connection
+    return {
+        'size': pool.size,
+        'free': pool.freesize,
+        'min_size': pool.minsize,
+        'max_size': pool.maxsize,
+    }
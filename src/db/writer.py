@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from typing import Optional, Dict, Tuple
+
+import aioredis
+from aioredis import Redis
+
+from core.metrics import backend_call
+
+logger = logging.getLogger(__name__)
+
+# Команда очереди: (имя, ключ, значение, время жизни, порядковый номер)
+Command = Tuple[str, str, Optional[bytes], int, int]
+
+
+class CacheWriter:
+    """
+    Фоновая запись в Redis: запрос только ставит команду в очередь и не ждёт сетевого прохода.
+    Команды отправляются пачками через пайплайн. При переполнении очереди новые записи
+    отбрасываются — кеш лишь наполнится позже, а запросы не встанут в ожидание.
+    Удаления идут через ту же очередь, поэтому применяются после всех поставленных раньше записей.
+    """
+
+    def __init__(self, redis: Redis, max_size: int, batch_size: int):
+        self.redis = redis
+        self.batch_size = batch_size
+        self.queued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.discarded = 0
+        self._seq = 0
+        # ключ -> номер последней команды перед удалением: более ранние записи этого ключа не отправляются
+        self._evicted: Dict[str, int] = {}
+        self._queue: 'asyncio.Queue[Command]' = asyncio.Queue(maxsize=max_size)
+        self._task: Optional[asyncio.Task] = None
+
+    def set(self, key: str, value: bytes, expire: int):
+        self._submit('set', key, value, expire)
+
+    def delete(self, key: str):
+        self._submit('delete', key, None, 0)
+
+    async def evict(self, *keys: str):
+        """
+        Удаляет ключи из Redis после всех уже поставленных в очередь команд, а поставленные записи
+        этих ключей отменяет: иначе запись старого значения, отправленная после сброса, вернула бы его в кеш.
+        В отличие от записей, удаления при заполненной очереди не отбрасываются, а ждут места.
+        """
+        for key in keys:
+            self._evicted[key] = self._seq
+        for key in keys:
+            self._seq += 1
+            await self._queue.put(('delete', key, None, 0, self._seq))
+            self.queued += 1
+
+    def _submit(self, name: str, key: str, value: Optional[bytes], expire: int):
+        self._seq += 1
+        try:
+            self._queue.put_nowait((name, key, value, expire, self._seq))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return
+        self.queued += 1
+
+    async def _flush(self, batch):
+        pipe = self.redis.pipeline()
+        commands = 0
+        for name, key, value, expire, seq in batch:
+            evicted = self._evicted.get(key)
+            if name == 'set':
+                if evicted is not None and seq <= evicted:
+                    self.discarded += 1
+                    continue
+                pipe.set(key, value, expire=expire)
+            else:
+                if evicted is not None and seq > evicted:
+                    # Все записи, поставленные до удаления, уже пройдены
+                    del self._evicted[key]
+                pipe.delete(key)
+            commands += 1
+        if not commands:
+            return
+        try:
+            with backend_call('redis', 'pipeline'):
+                await pipe.execute()
+        except (aioredis.RedisError, OSError) as error:
+            self.dropped += len(batch)
+            logger.error('Cache write of %d commands failed: %s', len(batch), error)
+            return
+        self.flushed += commands
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            # Забираем всё, что успело накопиться, но не больше одной пачки
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._flush(batch)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Дописываем то, что осталось в очереди на момент остановки
+        batch = []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch:
+            await self._flush(batch)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'queued': self.queued,
+            'flushed': self.flushed,
+            'dropped': self.dropped,
+            'discarded': self.discarded,
+            'pending': self._queue.qsize(),
+        }
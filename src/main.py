@@ -1,15 +1,28 @@
 import logging
+from http import HTTPStatus
 
 import aioredis
 import uvicorn
 from elasticsearch import AsyncElasticsearch
-from fastapi import FastAPI
+from elasticsearch import ConnectionError as ElasticConnectionError
+from fastapi import FastAPI, Request
 from fastapi.responses import ORJSONResponse
 
-from api.v1 import film, genre, person
-from core import config
+from api import health, metrics as metrics_api
+from api.v1 import film, genre, person, stats, suggest
+from core import config, metrics
+from core.cursor import InvalidCursor
+from core.errors import BackendUnavailable
 from core.logger import LOGGING
-from db import elastic, redis
+from core.profiling import ProfileMiddleware
+from core.readiness import readiness
+from db import cache, elastic, redis
+from db.cache import Cache
+from db.elastic import ElasticConnection
+from db.memory import LRUCache
+from db.writer import CacheWriter
+from services import invalidation, warmup
+from services.genre import genre_catalog
 
 app = FastAPI(
     title=config.PROJECT_NAME,
@@ -19,14 +32,82 @@ app = FastAPI(
 )
 
 
+# Время ответа по маршрутам и число запросов в обработке
+app.add_middleware(metrics.MetricsMiddleware)
+# Профиль запросов к Elasticsearch по заголовку X-Debug-Profile
+app.add_middleware(ProfileMiddleware)
+
+
+@app.exception_handler(BackendUnavailable)
+async def backend_unavailable_handler(request: Request, error: BackendUnavailable) -> ORJSONResponse:
+    # Быстрый отказ вместо ожидания таймаута: клиент или балансировщик повторит запрос позже
+    return ORJSONResponse(
+        status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+        content={'detail': 'service unavailable'},
+        headers={'Retry-After': str(error.retry_after)},
+    )
+
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_handler(request: Request, error: InvalidCursor) -> ORJSONResponse:
+    # Курсор не подходит к сортировке страницы: Elasticsearch отверг search_after
+    return ORJSONResponse(status_code=HTTPStatus.BAD_REQUEST, content={'detail': 'invalid cursor'})
+
+
+@app.exception_handler(ElasticConnectionError)
+async def elastic_unavailable_handler(request: Request, error: ElasticConnectionError) -> ORJSONResponse:
+    # Elasticsearch не ответил, а сохранённой копии нет
+    return ORJSONResponse(
+        status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+        content={'detail': 'service unavailable'},
+        headers={'Retry-After': str(config.ELASTIC_RETRY_AFTER_SECONDS)},
+    )
+
+
 @app.on_event('startup')
 async def startup():
-    redis.redis = await aioredis.create_redis_pool((config.REDIS_HOST, config.REDIS_PORT), minsize=10, maxsize=20)
-    elastic.es = AsyncElasticsearch(hosts=[f'{config.ELASTIC_HOST}:{config.ELASTIC_PORT}'])
+    redis.redis = await aioredis.create_redis_pool(
+        (config.REDIS_HOST, config.REDIS_PORT),
+        minsize=config.REDIS_POOL_MIN_SIZE,
+        maxsize=config.REDIS_POOL_MAX_SIZE,
+        timeout=config.REDIS_CONNECT_TIMEOUT,
+    )
+    elastic.es = AsyncElasticsearch(
+        hosts=[f'{config.ELASTIC_HOST}:{config.ELASTIC_PORT}'],
+        connection_class=ElasticConnection,
+        maxsize=config.ELASTIC_POOL_SIZE,
+        timeout=config.ELASTIC_TIMEOUT,
+        keepalive_timeout=config.ELASTIC_KEEPALIVE_TIMEOUT,
+        http_compress=config.ELASTIC_HTTP_COMPRESS,
+        max_retries=config.ELASTIC_MAX_RETRIES,
+        retry_on_timeout=config.ELASTIC_RETRY_ON_TIMEOUT,
+        sniff_on_start=config.ELASTIC_SNIFF_ON_START,
+        sniff_on_connection_fail=config.ELASTIC_SNIFF_ON_CONNECTION_FAIL,
+        sniffer_timeout=config.ELASTIC_SNIFFER_TIMEOUT or None,
+    )
+    writer = CacheWriter(redis.redis, config.CACHE_WRITE_QUEUE_SIZE, config.CACHE_WRITE_BATCH_SIZE)
+    writer.start()
+    cache.cache = Cache(
+        redis.redis,
+        LRUCache(config.MEMORY_CACHE_MAX_BYTES, config.MEMORY_CACHE_EXPIRE_IN_SECONDS),
+        writer,
+    )
+    # Сбрасываем из кешей документы, которые переиндексировал ETL
+    invalidation.start(cache.cache)
+    # Каталог жанров загружаем до приёма запросов, дальше он обновляется в фоне
+    await genre_catalog.start(elastic.es)
+    # Пока не закончится прогрев, воркер не принимает соединения и не считается готовым
+    if config.WARMUP_ENABLED:
+        await warmup.warm_up(app)
+    readiness.warmed = True
 
 
 @app.on_event('shutdown')
 async def shutdown():
+    await invalidation.stop()
+    await genre_catalog.stop()
+    await elastic.breaker.stop()
+    await cache.cache.writer.stop()
     await redis.redis.close()
     await elastic.es.close()
 
@@ -36,8 +117,13 @@ async def shutdown():
 app.include_router(film.router, prefix='/api/v1/film', tags=['film'])
 app.include_router(genre.router, prefix='/api/v1/genre', tags=['genre'])
 app.include_router(person.router, prefix='/api/v1/person', tags=['person'])
+app.include_router(suggest.router, prefix='/api/v1/suggest', tags=['suggest'])
+app.include_router(stats.router, prefix='/api/v1/stats', tags=['stats'])
+app.include_router(metrics_api.router)
+app.include_router(health.router)
 
 if __name__ == '__main__':
+    # Один процесс для разработки; в продакшене запускается server.py
     uvicorn.run(
         'main:app',
         host='0.0.0.0',
@@ -28,3 +28,24 @@ class Film(BaseModel):
         # Заменяем стандартную работу с json на более быструю
         json_loads = orjson.loads
         json_dumps = orjson_dumps
+
+
+class FilmItem:
+    """
+    Элемент списка фильмов: только поля, которые отдают списочные ручки.
+    Данные приходят из нашего же индекса, поэтому это простой объект со __slots__ без валидации:
+    в pydantic-модель ответа он перекладывается только на границе API.
+    """
+    __slots__ = ('id', 'title', 'imdb_rating')
+
+    def __init__(self, id: str, title: str, imdb_rating: float = 0.0):
+        self.id = id
+        self.title = title
+        self.imdb_rating = imdb_rating
+
+    @classmethod
+    def from_source(cls, source: dict) -> 'FilmItem':
+        return cls(source['id'], source['title'], source.get('imdb_rating') or 0.0)
+
+    def as_tuple(self) -> tuple:
+        return self.id, self.title, self.imdb_rating
@@ -0,0 +1,163 @@
+"""
+Запуск API в продакшене: родительский процесс открывает сокет и запускает на нём несколько воркеров uvicorn.
+Каждый воркер перед приёмом запросов прогревается (см. services.warmup), а при остановке
+сначала перестаёт быть готовым и только потом дожидается запросов в обработке.
+
+Запуск из каталога src:
+    SERVER_WORKERS=4 python server.py
+"""
+import asyncio
+import logging
+import os
+import signal
+import threading
+import time
+from typing import List
+
+import uvicorn
+from uvicorn.subprocess import get_subprocess
+
+from core import config
+from core.logger import LOGGING
+from core.readiness import readiness
+
+logger = logging.getLogger(__name__)
+
+HANDLED_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+# Как часто родитель проверяет, что воркеры живы, в секундах
+SUPERVISOR_CHECK_INTERVAL_IN_SECONDS = 1
+# Воркер, упавший раньше этого срока, перезапускается с удвоением паузы до максимума:
+# если не поднимается Redis, родитель не должен перезапускать воркеры каждую секунду
+WORKER_STABLE_IN_SECONDS = 30
+WORKER_RESTART_MAX_DELAY_IN_SECONDS = 60
+
+
+class Server(uvicorn.Server):
+    """
+    Воркер с плавной остановкой. По первому сигналу отвечает на /health/ready «не готов»,
+    но ещё SERVER_DRAIN_SECONDS обслуживает запросы, пока балансировщик убирает его из ротации.
+    Затем закрывает сокет и ждёт запросы в обработке не дольше SERVER_GRACEFUL_TIMEOUT_SECONDS.
+    Повторный сигнал останавливает воркер сразу.
+    """
+
+    def run(self, sockets=None):
+        # Своя группа процессов: Ctrl+C в терминале получает только родитель и пересылает его воркерам один раз
+        os.setpgrp()
+        # Маска сигналов наследуется от родителя, который блокирует их на время запуска воркера
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, HANDLED_SIGNALS)
+        super().run(sockets=sockets)
+
+    def handle_exit(self, sig, frame):
+        if readiness.draining or self.should_exit:
+            self.should_exit = True
+            self.force_exit = True
+            return
+        readiness.draining = True
+        asyncio.get_event_loop().call_later(config.SERVER_DRAIN_SECONDS, self._stop)
+
+    def _stop(self):
+        self.should_exit = True
+        asyncio.get_event_loop().call_later(config.SERVER_GRACEFUL_TIMEOUT_SECONDS, self._force_stop)
+
+    def _force_stop(self):
+        logger.warning('Requests did not finish in %ss, stopping anyway', config.SERVER_GRACEFUL_TIMEOUT_SECONDS)
+        self.force_exit = True
+
+
+class Supervisor:
+    """
+    Родительский процесс: держит сокет, перезапускает упавшие воркеры и пересылает им сигналы остановки.
+    Супервизор uvicorn сигналы не пересылает, а в контейнере SIGTERM получает только процесс с PID 1.
+    """
+
+    def __init__(self, server_config: uvicorn.Config):
+        self.config = server_config
+        self.server = Server(server_config)
+        self.processes: List = []
+        self.started_at: List[float] = []
+        self.restart_at: List[float] = []
+        self.restart_delay: List[float] = []
+        self.should_exit = threading.Event()
+
+    def run(self):
+        sockets = [self.config.bind_socket()]
+        for sig in HANDLED_SIGNALS:
+            signal.signal(sig, self.handle_exit)
+        logger.info('Starting %s workers', self.config.workers)
+        workers = self.config.workers
+        self.processes = [None] * workers
+        self.started_at = [0.0] * workers
+        self.restart_at = [0.0] * workers
+        self.restart_delay = [0.0] * workers
+        for index in range(workers):
+            if not self._spawn(index, sockets):
+                break
+        while not self.should_exit.wait(SUPERVISOR_CHECK_INTERVAL_IN_SECONDS):
+            for index, process in enumerate(self.processes):
+                if process.is_alive():
+                    continue
+                now = time.monotonic()
+                if not self.restart_at[index]:
+                    self._schedule_restart(index, process, now)
+                if now >= self.restart_at[index] and not self._spawn(index, sockets):
+                    break
+        for process in self.processes:
+            if process is not None:
+                process.join()
+        logger.info('All workers stopped')
+
+    def _schedule_restart(self, index: int, process, now: float):
+        if now - self.started_at[index] >= WORKER_STABLE_IN_SECONDS:
+            self.restart_delay[index] = 0.0
+        else:
+            self.restart_delay[index] = min(WORKER_RESTART_MAX_DELAY_IN_SECONDS,
+                                            max(1.0, self.restart_delay[index] * 2))
+        self.restart_at[index] = now + self.restart_delay[index]
+        logger.error('Worker %s exited with code %s, restarting in %ss',
+                     process.pid, process.exitcode, self.restart_delay[index])
+
+    def _spawn(self, index: int, sockets: list) -> bool:
+        """
+        Запускает воркер на место index. Возвращает False, если супервизор уже останавливается.
+        Сигналы на это время откладываются: иначе handle_exit мог бы сработать между проверкой
+        и запуском, и новый воркер не узнал бы об остановке.
+        """
+        signal.pthread_sigmask(signal.SIG_BLOCK, HANDLED_SIGNALS)
+        try:
+            if self.should_exit.is_set():
+                return False
+            process = get_subprocess(config=self.config, target=self.server.run, sockets=sockets)
+            process.start()
+            self.processes[index] = process
+            self.started_at[index] = time.monotonic()
+            self.restart_at[index] = 0.0
+            return True
+        finally:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, HANDLED_SIGNALS)
+
+    def handle_exit(self, sig, frame):
+        self.should_exit.set()
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                os.kill(process.pid, sig)
+
+
+def main():
+    server_config = uvicorn.Config(
+        'main:app',
+        host=config.SERVER_HOST,
+        port=config.SERVER_PORT,
+        workers=config.SERVER_WORKERS,
+        loop=config.SERVER_LOOP,
+        http=config.SERVER_HTTP,
+        backlog=config.SERVER_BACKLOG,
+        timeout_keep_alive=config.SERVER_KEEP_ALIVE_SECONDS,
+        # Ошибка при старте (например, недоступен Redis) должна завершать воркер, а не оставлять его без пулов
+        lifespan='on',
+        log_config=LOGGING,
+    )
+    Supervisor(server_config).run()
+
+
+if __name__ == '__main__':
+    main()
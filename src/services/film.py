@@ -1,116 +1,318 @@
 from functools import lru_cache
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple, Callable, Awaitable
 
-from aioredis import Redis
 from elasticsearch import AsyncElasticsearch
 from fastapi import Depends
 
-from db.elastic import get_elastic
-from db.redis import get_redis
-from models.film import Film
+from core import config
+from core.etag import tag, untag
+from core.singleflight import SingleFlight
+from db import codec
+from db.cache import Cache, get_cache, make_key, entity_key, RESPONSE_KEY_SUFFIX
+from db.elastic import get_elastic, search, search_after, get_document, get_documents, UNAVAILABLE_ERRORS
+from models.film import Film, FilmItem
+from services.queries import FILM_SEARCH_FIELDS, search_query
 
-FILM_CACHE_EXPIRE_IN_SECONDS = 60 * 5
+FILM_CACHE_EXPIRE_IN_SECONDS = config.FILM_CACHE_EXPIRE_IN_SECONDS
+FILM_SEARCH_CACHE_EXPIRE_IN_SECONDS = 60
+FILM_LIST_CACHE_EXPIRE_IN_SECONDS = 60
+FILM_ITEM_FIELDS = list(FilmItem.__slots__)
+# Массивы имён выводятся из вложенных жанров и персон, поэтому в кеше не хранятся
+FILM_DERIVED_FIELDS = {
+    'genre': 'genres',
+    'writers_names': 'writers',
+    'directors_names': 'directors',
+    'actors_names': 'actors',
+}
+
+
+def pack_film(film: Film) -> bytes:
+    # Поля со значениями по умолчанию (заглушки вроде [{}]) тоже не храним
+    return codec.dumps(film.dict(exclude=set(FILM_DERIVED_FIELDS), exclude_defaults=True))
+
+
+def unpack_film(data: bytes) -> Film:
+    fields = codec.loads(data)
+    for derived, source in FILM_DERIVED_FIELDS.items():
+        if source in fields:
+            fields[derived] = [x.get('name') for x in fields[source]]
+    # Запись в кеш сделана из уже проверенной модели, повторная валидация не нужна
+    return Film.construct(**fields)
 
 
 class FilmService:
-    def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
-        self.redis = redis
+    def __init__(self, cache: Cache, elastic: AsyncElasticsearch):
+        self.cache = cache
         self.elastic = elastic
+        self.flight = SingleFlight()
 
-    async def search_films(self, body: Dict):
-        doc = await self.elastic.search(index='movies', body=body)
-        list_films = [Film(**x['_source']) for x in doc['hits']['hits']]
+    async def search_films(self, body: Dict) -> List[FilmItem]:
+        # Списочным ручкам нужны три поля: не тянем из индекса вложенных персон и массивы имён
+        body['_source'] = FILM_ITEM_FIELDS
+        doc = await search(self.elastic, 'movies', body=body)
+        list_films = [FilmItem.from_source(x['_source']) for x in doc['hits']['hits']]
         return list_films
 
-    async def get_film_search(self, query: str, page_size: int, page_number: int) -> List[Film]:
-        body = {
-            'size': page_size,
-            'from': (page_number - 1) * page_size,
-            'query': {
-                'simple_query_string': {
-                    "query": query,
-                    "fields": ["title^3", "description"],
-                    "default_operator": "or"
-                }
-            }
-        }
-        doc = await self.search_films(body)
-        return doc
+    async def search_films_after(self, body: Dict,
+                                 after: Optional[list]) -> Tuple[List[FilmItem], Optional[list]]:
+        """
+        Постраничная выдача через search_after: стоимость страницы не зависит от её глубины.
+        Возвращает фильмы и значения сортировки последнего из них — с них начнётся следующая страница.
+        """
+        body['_source'] = FILM_ITEM_FIELDS
+        doc = await search_after(self.elastic, 'movies', body, after)
+        hits = doc['hits']['hits']
+        list_films = [FilmItem.from_source(x['_source']) for x in hits]
+        last_sort = hits[-1]['sort'] if hits and len(hits) == body['size'] else None
+        return list_films, last_sort
 
-    async def get_film_pagination(self, sort: str, page_size: int, page_number: int, filter_genre: str) -> List[Film]:
+    @staticmethod
+    def _pagination_sort(sort: str) -> Dict:
         order_value = 'asc'
         if sort.startswith('-'):
             sort = sort[1:]
             order_value = 'desc'
-        body = {
-            'size': page_size,
-            'from': (page_number - 1) * page_size,
-            'sort': {
-                sort: {
-                    'order': order_value
-                }
+        return {
+            sort: {
+                'order': order_value
             }
         }
-        if filter_genre:
-            body['query'] = {
-                'bool': {
-                    'filter': {
-                        'nested': {
-                            'path': 'genres',
-                            'query': {
-                                'bool': {
-                                    'filter': {
-                                        'term': {'genres.id': filter_genre}
-                                    }
+
+    @staticmethod
+    def _genre_filter(filter_genre: str) -> Dict:
+        return {
+            'bool': {
+                'filter': {
+                    'nested': {
+                        'path': 'genres',
+                        'query': {
+                            'bool': {
+                                'filter': {
+                                    'term': {'genres.id': filter_genre}
                                 }
                             }
                         }
                     }
                 }
             }
-        doc = await self.search_films(body)
-        return doc
+        }
+
+    async def get_film_search(self, query: str, page_size: int, page_number: int) -> List[FilmItem]:
+        key = make_key('film:search', query=query, page_size=page_size, page_number=page_number)
+        films = await self._films_from_cache(key)
+        if films is not None:
+            return films
+        body = {
+            'size': page_size,
+            'from': (page_number - 1) * page_size,
+            'query': search_query(query, FILM_SEARCH_FIELDS)
+        }
+        try:
+            films = await self.search_films(body)
+        except UNAVAILABLE_ERRORS:
+            # Elasticsearch недоступен — отдаём последнюю удачную страницу, а если её нет, пробрасываем ошибку
+            films = await self._films_from_cache(key, shadow=True)
+            if films is None:
+                raise
+            return films
+        await self._put_films_to_cache(key, films, FILM_SEARCH_CACHE_EXPIRE_IN_SECONDS)
+        return films
+
+    async def get_film_search_after(self, query: str, page_size: int,
+                                    search_after: Optional[list]) -> Tuple[List[FilmItem], Optional[list]]:
+        body = {
+            'size': page_size,
+            'query': search_query(query, FILM_SEARCH_FIELDS),
+            # id — уникальный тай-брейкер, без него фильмы с равной релевантностью могут потеряться между страницами
+            'sort': [{'_score': 'desc'}, {'id': 'asc'}]
+        }
+        return await self.search_films_after(body, search_after)
+
+    async def get_film_pagination(self, sort: str, page_size: int, page_number: int,
+                                  filter_genre: str) -> List[FilmItem]:
+        key = make_key('film:list', sort=sort, page_size=page_size, page_number=page_number, filter_genre=filter_genre)
+        films = await self._films_from_cache(key)
+        if films is not None:
+            return films
+        body = {
+            'size': page_size,
+            'from': (page_number - 1) * page_size,
+            'sort': self._pagination_sort(sort)
+        }
+        if filter_genre:
+            body['query'] = self._genre_filter(filter_genre)
+        try:
+            films = await self.search_films(body)
+        except UNAVAILABLE_ERRORS:
+            # Elasticsearch недоступен — отдаём последнюю удачную страницу, а если её нет, пробрасываем ошибку
+            films = await self._films_from_cache(key, shadow=True)
+            if films is None:
+                raise
+            return films
+        await self._put_films_to_cache(key, films, FILM_LIST_CACHE_EXPIRE_IN_SECONDS)
+        return films
+
+    async def get_film_pagination_after(self, sort: str, page_size: int, filter_genre: str,
+                                        search_after: Optional[list]) -> Tuple[List[FilmItem], Optional[list]]:
+        body = {
+            'size': page_size,
+            'sort': [self._pagination_sort(sort), {'id': 'asc'}]
+        }
+        if filter_genre:
+            body['query'] = self._genre_filter(filter_genre)
+        return await self.search_films_after(body, search_after)
 
     # get_by_id возвращает объект фильма. Он опционален, так как фильм может отсутствовать в базе
-    async def get_by_id(self, film_id: str) -> Optional[Film]:
-        # Пытаемся получить данные из кеша, потому что оно работает быстрее
-        film = await self._film_from_cache(film_id)
+    async def get_by_id(self, film_id: str, shadow: bool = True) -> Optional[Film]:
+        # Пытаемся получить данные из кеша, потому что оно работает быстрее.
+        # Устаревшую запись кеш отдаёт сразу, а свежую загружает в фоне
+        film = await self._film_from_cache(film_id, refresh=lambda: self._load_film_once(film_id))
         if not film:
+            film = await self._load_film_once(film_id, shadow)
+
+        return film
+
+    def _load_film_once(self, film_id: str, shadow: bool = True) -> Awaitable[Optional[Film]]:
+        # Одновременные загрузки одного фильма объединяем в один поход в Elasticsearch
+        key = film_id if shadow else film_id + ':fresh'
+        return self.flight.do(key, lambda: self._load_film(film_id, shadow))
+
+    async def _load_film(self, film_id: str, shadow: bool = True) -> Optional[Film]:
+        """
+        Загружает фильм из Elasticsearch в кеш. Если Elasticsearch недоступен, при shadow=True
+        возвращается теневая копия, а при shadow=False ошибка пробрасывается — так делают те,
+        кто кеширует результат дальше и не должен выдать старую копию за свежие данные.
+        """
+        key = entity_key('film', film_id)
+        locked = await self.cache.lock(key)
+        if not locked:
+            # Фильм уже загружает другой воркер — ждём, пока он положит его в кеш
+            await self.cache.wait_unlock(key)
+            film = await self._film_from_cache(film_id)
+            if film:
+                return film
+        try:
             # Если фильма нет в кеше, то ищем его в Elasticsearch
-            film = await self._get_film_from_elastic(film_id)
+            try:
+                film = await self._get_film_from_elastic(film_id)
+            except UNAVAILABLE_ERRORS:
+                if not shadow:
+                    raise
+                # Elasticsearch недоступен — отдаём последнюю сохранённую копию, если она есть
+                data = await self.cache.get_shadow(key)
+                if not data:
+                    raise
+                return unpack_film(data)
             if not film:
                 # Если он отсутствует в Elasticsearch, значит, фильма вообще нет в базе
                 return None
             # Сохраняем фильм  в кеш
             await self._put_film_to_cache(film)
+        finally:
+            if locked:
+                await self.cache.unlock(key)
 
         return film
 
+    async def get_response_by_id(self, film_id: str,
+                                 render: Callable[[Film], bytes]) -> Optional[Tuple[str, bytes]]:
+        """
+        Быстрый путь карточки фильма: в кеше лежит уже сериализованное тело ответа,
+        которое отдаётся клиенту как есть, без разбора в pydantic-модели.
+        Возвращает ETag и тело ответа.
+        """
+        key = entity_key('film', film_id) + RESPONSE_KEY_SUFFIX
+        # Фоновое обновление берёт фильм из Elasticsearch, а не из кеша, который мог тоже устареть.
+        # Отрендеренный ответ кешируется заново, поэтому теневые копии фильма для него не годятся
+        data = await self.cache.get(
+            key, refresh=lambda: self._render_film(key, render, self._load_film_once(film_id, shadow=False)))
+        if not data:
+            try:
+                data = await self.flight.do(
+                    key, lambda: self._render_film(key, render, self.get_by_id(film_id, shadow=False)))
+            except UNAVAILABLE_ERRORS:
+                # Elasticsearch недоступен — отдаём теневую копию самого ответа или рендерим теневую копию
+                # фильма, но в кеш ничего не записываем
+                data = await self.cache.get_shadow(key)
+                if not data:
+                    film = await self.get_by_id(film_id)
+                    data = tag(render(film)) if film else None
+        if not data:
+            return None
+        return untag(data)
+
+    async def _render_film(self, key: str, render: Callable[[Film], bytes],
+                           load: Awaitable[Optional[Film]]) -> Optional[bytes]:
+        film = await load
+        if not film:
+            return None
+        # ETag считается один раз при рендере и хранится вместе с телом
+        data = tag(render(film))
+        await self.cache.set(key, data, expire=FILM_CACHE_EXPIRE_IN_SECONDS, shadow=True)
+        return data
+
+    async def get_by_ids(self, film_ids: List[str]) -> List[Film]:
+        # Убираем повторы, сохраняя порядок, в котором фильмы запрошены
+        film_ids = list(dict.fromkeys(film_ids))
+        films = {}
+        cached = await self.cache.mget([entity_key('film', x) for x in film_ids])
+        for film_id, data in zip(film_ids, cached):
+            if data:
+                films[film_id] = unpack_film(data)
+        missing = [film_id for film_id in film_ids if film_id not in films]
+        if missing:
+            # В Elasticsearch идём одним _mget и только за теми фильмами, которых нет в кеше
+            try:
+                found = await self._get_films_from_elastic(missing)
+            except UNAVAILABLE_ERRORS:
+                # Без Elasticsearch отдаём то, что нашлось в теневых копиях
+                shadows = await self.cache.get_shadow_many([entity_key('film', x) for x in missing])
+                films.update({film_id: unpack_film(data) for film_id, data in zip(missing, shadows) if data})
+                return [films[film_id] for film_id in film_ids if film_id in films]
+            await self.cache.set_many({entity_key('film', str(x.id)): pack_film(x) for x in found},
+                                      expire=FILM_CACHE_EXPIRE_IN_SECONDS, shadow=True)
+            films.update({str(x.id): x for x in found})
+        return [films[film_id] for film_id in film_ids if film_id in films]
+
+    async def _get_films_from_elastic(self, film_ids: List[str]) -> List[Film]:
+        doc = await get_documents(self.elastic, 'movies', film_ids)
+        return [Film.construct(**x['_source']) for x in doc['docs'] if x.get('found')]
+
     async def _get_film_from_elastic(self, film_id: str) -> Optional[Film]:
-        doc = await self.elastic.get('movies', film_id)
-        return Film(**doc['_source'])
+        doc = await get_document(self.elastic, 'movies', film_id)
+        # Документы индекса пишет наш ETL, поэтому модель собирается без валидации
+        return Film.construct(**doc['_source'])
 
-    async def _film_from_cache(self, film_id: str) -> Optional[Film]:
-        # Пытаемся получить данные о фильме из кеша, используя команду get
-        # https://redis.io/commands/get
-        data = await self.redis.get(film_id)
+    async def _film_from_cache(self, film_id: str,
+                               refresh: Optional[Callable[[], Awaitable]] = None) -> Optional[Film]:
+        # Пытаемся получить данные о фильме из кеша: сначала из памяти процесса, затем из Redis
+        data = await self.cache.get(entity_key('film', film_id), refresh)
         if not data:
             return None
-        # pydantic предоставляет удобное API для создания объекта моделей из json
-        film = Film.parse_raw(data)
+        film = unpack_film(data)
         return film
 
     async def _put_film_to_cache(self, film: Film):
         # Сохраняем данные о фильме, используя команду set
-        # Выставляем время жизни кеша — 5 минут
+        # Время жизни кеша задаётся в настройках, об изменениях фильма сообщает ETL
         # https://redis.io/commands/set
-        # pydantic позволяет сериализовать модель в json
-        await self.redis.set(str(film.id), film.json(), expire=FILM_CACHE_EXPIRE_IN_SECONDS)
+        await self.cache.set(entity_key('film', str(film.id)), pack_film(film), expire=FILM_CACHE_EXPIRE_IN_SECONDS,
+                             shadow=True)
+
+    async def _films_from_cache(self, key: str, shadow: bool = False) -> Optional[List[FilmItem]]:
+        # Страница выдачи хранится целиком под ключом, построенным из параметров запроса
+        data = await (self.cache.get_shadow(key) if shadow else self.cache.get(key))
+        if data is None:
+            return None
+        return [FilmItem(*x) for x in codec.loads(data)]
+
+    async def _put_films_to_cache(self, key: str, films: List[FilmItem], expire: int):
+        await self.cache.set(key, codec.dumps([x.as_tuple() for x in films]), expire=expire, shadow=True)
 
 
 @lru_cache()
 def get_film_service(
-        redis: Redis = Depends(get_redis),
+        cache: Cache = Depends(get_cache),
         elastic: AsyncElasticsearch = Depends(get_elastic),
 ) -> FilmService:
-    return FilmService(redis, elastic)
+    return FilmService(cache, elastic)
@@ -1,55 +1,262 @@
+import asyncio
+import logging
 from functools import lru_cache
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Callable, Awaitable, Tuple
 
-from aioredis import Redis
-from elasticsearch import AsyncElasticsearch
+import orjson
+from elasticsearch import AsyncElasticsearch, ElasticsearchException
 from fastapi import Depends
 
-from db.elastic import get_elastic
-from db.redis import get_redis
+from core import config
+from core.etag import tag, untag
+from core.errors import BackendUnavailable
+from core.profiling import profile_requested
+from core.singleflight import SingleFlight
+from db import codec
+from db.cache import Cache, get_cache, make_key, entity_key
+from db.elastic import get_elastic, search, get_document, UNAVAILABLE_ERRORS
 from models.genre import Genre
+from services.queries import FILM_SEARCH_FIELDS, search_query
 
-GENRE_CACHE_EXPIRE_IN_SECONDS = 60 * 5
+GENRE_CACHE_EXPIRE_IN_SECONDS = config.GENRE_CACHE_EXPIRE_IN_SECONDS
+GENRE_LIST_CACHE_EXPIRE_IN_SECONDS = 60 * 5
+GENRE_LIST_CACHE_KEY = make_key('genre:list')
+GENRE_CATALOG_REFRESH_IN_SECONDS = config.GENRE_CATALOG_REFRESH_IN_SECONDS
+# Счётчики по всему каталогу сбрасываются, когда ETL загружает фильмы, поэтому живут долго;
+# счётчики по поисковому запросу не сбрасываются и живут столько же, сколько страницы поиска
+GENRE_FACETS_CACHE_EXPIRE_IN_SECONDS = config.GENRE_FACETS_CACHE_EXPIRE_IN_SECONDS
+GENRE_FACETS_SEARCH_CACHE_EXPIRE_IN_SECONDS = 60
+GENRE_FACETS_CACHE_KEY = make_key('genre:facets')
+GENRE_FACETS_MAX_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+class GenreCatalog:
+    """
+    Каталог жанров в памяти процесса. Жанров мало и меняются они редко, поэтому каталог
+    загружается целиком при старте и обновляется периодически или по сигналу от ETL.
+    """
+
+    def __init__(self):
+        self.genres: List[Genre] = []
+        self.by_id: Dict[str, Genre] = {}
+        # Готовые тела ответов по жанрам вместе с ETag, сбрасываются при каждом обновлении каталога
+        self.responses: Dict[str, bytes] = {}
+        self.loaded = False
+        self._task: Optional[asyncio.Task] = None
+        self._changed: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    async def refresh(self, elastic: AsyncElasticsearch):
+        try:
+            doc = await search(elastic, 'genres', size=1000)
+        except (ElasticsearchException, BackendUnavailable) as error:
+            # Пока Elasticsearch недоступен или перегружен, продолжаем отдавать прежний каталог
+            logger.error('Genre catalog refresh failed: %s', error)
+            return
+        genres = [Genre(**x['_source']) for x in doc['hits']['hits']]
+        self.genres = genres
+        self.by_id = {str(x.id): x for x in genres}
+        self.responses = {}
+        self.loaded = True
+
+    def refresh_soon(self):
+        if self._changed:
+            self._changed.set()
+
+    async def _run(self, elastic: AsyncElasticsearch):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._changed.wait(), GENRE_CATALOG_REFRESH_IN_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping:
+                break
+            self._changed.clear()
+            await self.refresh(elastic)
+
+    async def start(self, elastic: AsyncElasticsearch):
+        self._changed = asyncio.Event()
+        self._stopping = False
+        await self.refresh(elastic)
+        self._task = asyncio.ensure_future(self._run(elastic))
+
+    async def stop(self):
+        if self._task:
+            # До Python 3.12 wait_for может проглотить отмену, пришедшую одновременно с сигналом об обновлении,
+            # и цикл ушёл бы ждать следующего периода, поэтому завершение дублируется флагом
+            self._stopping = True
+            self._changed.set()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+genre_catalog = GenreCatalog()
+
+
+async def get_genre_catalog() -> GenreCatalog:
+    return genre_catalog
 
 
 class GenreService:
-    def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
-        self.redis = redis
+    def __init__(self, cache: Cache, elastic: AsyncElasticsearch, catalog: GenreCatalog):
+        self.cache = cache
         self.elastic = elastic
+        self.catalog = catalog
+        self.flight = SingleFlight()
 
     async def genre_detail(self, genre_id: str):
-        genre = await self._genre_from_cache(genre_id)
+        genre = self.catalog.by_id.get(genre_id)
+        if genre:
+            return genre
+        # Жанра ещё нет в каталоге (например, ETL добавил его после последнего обновления)
+        genre = await self._genre_from_cache(genre_id, refresh=lambda: self._load_genre_once(genre_id))
+        if not genre:
+            genre = await self._load_genre_once(genre_id)
+
+        return genre
+
+    async def genre_detail_raw(self, genre_id: str,
+                               render: Callable[[Genre], bytes]) -> Optional[Tuple[str, bytes]]:
+        # Тело ответа для жанра из каталога сериализуем один раз и дальше отдаём готовые байты
+        data = self.catalog.responses.get(genre_id)
+        if data is not None:
+            return untag(data)
+        genre = await self.genre_detail(genre_id)
         if not genre:
-            genre = await self._get_genre_from_elastic(genre_id)
+            return None
+        data = tag(render(genre))
+        if genre_id in self.catalog.by_id:
+            self.catalog.responses[genre_id] = data
+        return untag(data)
+
+    def _load_genre_once(self, genre_id: str) -> Awaitable[Optional[Genre]]:
+        return self.flight.do(genre_id, lambda: self._load_genre(genre_id))
+
+    async def _load_genre(self, genre_id: str) -> Optional[Genre]:
+        key = entity_key('genre', genre_id)
+        locked = await self.cache.lock(key)
+        if not locked:
+            await self.cache.wait_unlock(key)
+            genre = await self._genre_from_cache(genre_id)
+            if genre:
+                return genre
+        try:
+            try:
+                genre = await self._get_genre_from_elastic(genre_id)
+            except UNAVAILABLE_ERRORS:
+                # Elasticsearch недоступен — отдаём последнюю сохранённую копию, если она есть
+                data = await self.cache.get_shadow(key)
+                if not data:
+                    raise
+                return Genre(**codec.loads(data))
             if not genre:
                 return None
             await self._put_genre_to_cache(genre)
+        finally:
+            if locked:
+                await self.cache.unlock(key)
 
         return genre
 
     async def _get_genre_from_elastic(self, genre_id: str) -> Optional[Genre]:
-        doc = await self.elastic.get('genres', genre_id)
+        doc = await get_document(self.elastic, 'genres', genre_id)
         return Genre(**doc['_source'])
 
-    async def _genre_from_cache(self, genre_id: str) -> Optional[Genre]:
-        data = await self.redis.get(genre_id)
+    async def _genre_from_cache(self, genre_id: str,
+                                refresh: Optional[Callable[[], Awaitable]] = None) -> Optional[Genre]:
+        data = await self.cache.get(entity_key('genre', genre_id), refresh)
         if not data:
             return None
-        genre = Genre.parse_raw(data)
+        genre = Genre(**codec.loads(data))
         return genre
 
     async def _put_genre_to_cache(self, genre: Genre):
-        await self.redis.set(str(genre.id), genre.json(), expire=GENRE_CACHE_EXPIRE_IN_SECONDS)
+        await self.cache.set(entity_key('genre', str(genre.id)), codec.dumps(genre.dict()),
+                             expire=GENRE_CACHE_EXPIRE_IN_SECONDS, shadow=True)
 
     async def genre_main(self):
-        doc = await self.elastic.search(index='genres', size=1000)
+        if self.catalog.loaded and not profile_requested.get():
+            return self.catalog.genres
+        data = await self.cache.get(GENRE_LIST_CACHE_KEY)
+        if data is not None:
+            return [Genre(**x) for x in codec.loads(data)]
+        try:
+            doc = await search(self.elastic, 'genres', size=1000)
+        except UNAVAILABLE_ERRORS:
+            data = await self.cache.get_shadow(GENRE_LIST_CACHE_KEY)
+            if data is None:
+                raise
+            return [Genre(**x) for x in codec.loads(data)]
         list_genres = [Genre(**x['_source']) for x in doc['hits']['hits']]
+        await self.cache.set(GENRE_LIST_CACHE_KEY, codec.dumps([x.dict() for x in list_genres]),
+                             expire=GENRE_LIST_CACHE_EXPIRE_IN_SECONDS, shadow=True)
         return list_genres
 
+    async def genre_facets_raw(self, query: Optional[str]) -> Tuple[str, bytes]:
+        """
+        Число фильмов по жанрам, при заданном запросе — только среди найденных фильмов.
+        Возвращает ETag и готовое тело ответа.
+        """
+        key = make_key('genre:facets', query=query or None)
+        data = await self.cache.get(key)
+        if data is None:
+            data = await self.flight.do(key, lambda: self._load_genre_facets(key, query))
+        return untag(data)
+
+    async def _load_genre_facets(self, key: str, query: Optional[str]) -> bytes:
+        # Одна агрегация вместо запроса на каждый жанр: terms по вложенным жанрам,
+        # а reverse_nested считает фильмы, а не вложенные документы
+        body = {
+            'size': 0,
+            'aggs': {
+                'genres': {
+                    'nested': {'path': 'genres'},
+                    'aggs': {
+                        'ids': {
+                            'terms': {'field': 'genres.id', 'size': GENRE_FACETS_MAX_SIZE},
+                            'aggs': {'films': {'reverse_nested': {}}}
+                        }
+                    }
+                }
+            }
+        }
+        if query:
+            body['query'] = search_query(query, FILM_SEARCH_FIELDS)
+        try:
+            doc = await search(self.elastic, 'movies', body=body)
+        except UNAVAILABLE_ERRORS:
+            data = await self.cache.get_shadow(key)
+            if data is None:
+                raise
+            return data
+        facets = []
+        complete = True
+        for bucket in doc['aggregations']['genres']['ids']['buckets']:
+            genre = self.catalog.by_id.get(bucket['key'])
+            if not genre:
+                # ETL загружает фильмы и жанры по отдельности, поэтому жанр фильма может ещё не попасть в индекс
+                # жанров. Такой жанр пропускаем, а неполный ответ держим в кеше недолго
+                complete = False
+                continue
+            facets.append({'uuid': bucket['key'], 'name': genre.name, 'count': bucket['films']['doc_count']})
+        if not complete:
+            self.catalog.refresh_soon()
+        data = tag(orjson.dumps(facets))
+        long_lived = complete and not query
+        expire = GENRE_FACETS_CACHE_EXPIRE_IN_SECONDS if long_lived else GENRE_FACETS_SEARCH_CACHE_EXPIRE_IN_SECONDS
+        await self.cache.set(key, data, expire=expire, shadow=True)
+        return data
+
 
 @lru_cache()
 def get_genre_service(
-        redis: Redis = Depends(get_redis),
+        cache: Cache = Depends(get_cache),
         elastic: AsyncElasticsearch = Depends(get_elastic),
+        catalog: GenreCatalog = Depends(get_genre_catalog),
 ) -> GenreService:
-    return GenreService(redis, elastic)
+    return GenreService(cache, elastic, catalog)
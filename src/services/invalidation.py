@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from typing import Optional
+
+import aioredis
+import orjson
+
+from core import config
+from db.cache import Cache, RESPONSE_KEY_SUFFIX, entity_key
+from services.genre import GENRE_LIST_CACHE_KEY, GENRE_FACETS_CACHE_KEY, genre_catalog
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY_IN_SECONDS = 1
+
+# Индекс Elasticsearch -> сущность в ключах кеша
+INDEX_ENTITIES = {
+    'movies': 'film',
+    'genres': 'genre',
+    'persons': 'person',
+}
+
+# Ключи, которые сбрасываются вместе с любыми документами индекса
+INDEX_EXTRA_KEYS = {
+    'movies': [GENRE_FACETS_CACHE_KEY],
+    'genres': [GENRE_LIST_CACHE_KEY, GENRE_FACETS_CACHE_KEY],
+}
+
+task: Optional[asyncio.Task] = None
+
+
+async def evict(cache: Cache, message: bytes):
+    event = orjson.loads(message)
+    entity = INDEX_ENTITIES[event['index']]
+    keys = list(INDEX_EXTRA_KEYS.get(event['index'], []))
+    for doc_id in event['ids']:
+        key = entity_key(entity, doc_id)
+        keys.extend([key, key + RESPONSE_KEY_SUFFIX])
+    if keys:
+        await cache.delete(*keys)
+    if event['index'] == 'genres':
+        genre_catalog.refresh_soon()
+
+
+async def listen(cache: Cache):
+    """
+    Слушает канал, в который ETL публикует идентификаторы переиндексированных документов,
+    и сбрасывает их из Redis и из памяти процесса. Каждый воркер подписан сам.
+    """
+    while True:
+        try:
+            channel, = await cache.redis.subscribe(config.CACHE_INVALIDATION_CHANNEL)
+            async for message in channel.iter():
+                try:
+                    await evict(cache, message)
+                except (ValueError, KeyError, TypeError):
+                    logger.warning('Skip malformed invalidation message: %r', message)
+        except (aioredis.RedisError, OSError) as error:
+            logger.error('Cache invalidation subscription failed: %s', error)
+        await asyncio.sleep(RECONNECT_DELAY_IN_SECONDS)
+
+
+def start(cache: Cache):
+    global task
+    task = asyncio.ensure_future(listen(cache))
+
+
+async def stop():
+    if task:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
@@ -1,127 +1,184 @@
 from functools import lru_cache
-from typing import Optional, List, Tuple, Dict, Coroutine, Any
+from typing import Optional, List, Tuple, Dict, Coroutine, Any, Callable, Awaitable
 
-from aioredis import Redis
+import orjson
 from elasticsearch import AsyncElasticsearch
 from fastapi import Depends
 
-from db.elastic import get_elastic
-from db.redis import get_redis
+from core import config
+from core.etag import tag, untag
+from core.singleflight import SingleFlight
+from db import codec
+from db.cache import Cache, get_cache, make_key, entity_key
+from db.elastic import get_elastic, search, search_after, get_document, UNAVAILABLE_ERRORS
 from models.person import Person
+from services.queries import PERSON_SEARCH_FIELDS, search_query
 
-PERSON_CACHE_EXPIRE_IN_SECONDS = 1 * 1
+PERSON_CACHE_EXPIRE_IN_SECONDS = config.PERSON_CACHE_EXPIRE_IN_SECONDS
+PERSON_SEARCH_CACHE_EXPIRE_IN_SECONDS = 60
+ROLE_FILMS_PAGE_SIZE = 1000
+# Поле фильма с персонами -> роль в ответе API
+PERSON_ROLES = {
+    'writers': 'writer',
+    'directors': 'director',
+    'actors': 'actor',
+}
 
 
 class PersonService:
-    def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
-        self.redis = redis
+    def __init__(self, cache: Cache, elastic: AsyncElasticsearch):
+        self.cache = cache
         self.elastic = elastic
-
-    async def person_detail(self, person_id: str) -> Optional[Tuple[Person, Optional[List[dict]]]]:
-        person_full = None
-        person = await self._person_from_cache(person_id)
-        if not person:
-            person = await self._get_person_from_elastic(person_id)
-            if not person:
-                return None
-            person_roles = await self._get_person_full(person_id)
-            await self._put_person_to_cache(person)
+        self.flight = SingleFlight()
+
+    async def person_detail_raw(self, person_id: str) -> Optional[Tuple[str, bytes]]:
+        # В кеше лежит ровно тело ответа с его ETag, поэтому при попадании отдаём байты без разбора
+        data = await self.cache.get(entity_key('person', person_id), refresh=lambda: self._load_person_once(person_id))
+        if data:
+            return untag(data)
+        person_full = await self._load_person_once(person_id)
+        if not person_full:
+            return None
+        return untag(tag(orjson.dumps(person_full)))
+
+    def _load_person_once(self, person_id: str) -> Awaitable[Optional[List[dict]]]:
+        # Одновременные загрузки одной персоны объединяем в один поход в Elasticsearch
+        return self.flight.do(person_id, lambda: self._load_person(person_id))
+
+    async def _load_person(self, person_id: str) -> Optional[List[dict]]:
+        key = entity_key('person', person_id)
+        locked = await self.cache.lock(key)
+        if not locked:
+            await self.cache.wait_unlock(key)
+            person_full = await self._person_from_cache(person_id)
+            if person_full:
+                return person_full
+        try:
+            try:
+                person = await self._get_person_from_elastic(person_id)
+                if not person:
+                    return None
+                person_roles = await self._get_person_full(person_id)
+            except UNAVAILABLE_ERRORS:
+                # Elasticsearch недоступен — отдаём последнюю сохранённую копию, если она есть
+                data = await self.cache.get_shadow(key)
+                if not data:
+                    raise
+                return orjson.loads(untag(data)[1])
             person_full = [
                 {
                     'uuid': person.id,
                     'full_name': person.full_name,
-                    'role': 'writer',
-                    'film_ids': person_roles['writer']
-                },
-                {
-                    'uuid': person.id,
-                    'full_name': person.full_name,
-                    'role': 'director',
-                    'film_ids': person_roles['director']
-                },
-                {
-                    'uuid': person.id,
-                    'full_name': person.full_name,
-                    'role': 'actor',
-                    'film_ids': person_roles['actor']
+                    'role': role,
+                    'film_ids': film_ids
                 }
+                for role, film_ids in person_roles.items()
             ]
+            await self._put_person_to_cache(person_id, person_full)
+        finally:
+            if locked:
+                await self.cache.unlock(key)
 
         return person_full
 
     async def _get_person_from_elastic(self, person_id: str) -> Optional[Person]:
-        doc = await self.elastic.get('persons', person_id)
+        doc = await get_document(self.elastic, 'persons', person_id)
         return Person(**doc['_source'])
 
-    async def _person_from_cache(self, person_id: str) -> Optional[Person]:
-        data = await self.redis.get(person_id)
+    async def _person_from_cache(self, person_id: str,
+                                 refresh: Optional[Callable[[], Awaitable]] = None) -> Optional[List[dict]]:
+        data = await self.cache.get(entity_key('person', person_id), refresh)
         if not data:
             return None
-        person = Person.parse_raw(data)
-        return person
+        return orjson.loads(untag(data)[1])
 
-    async def _put_person_to_cache(self, person: Person):
-        await self.redis.set(str(person.id), person.json(), expire=PERSON_CACHE_EXPIRE_IN_SECONDS)
+    async def _put_person_to_cache(self, person_id: str, person_full: List[dict]):
+        # Ответ по персоне отдаётся клиенту как есть, поэтому хранится в json, а не в msgpack
+        await self.cache.set(entity_key('person', person_id), tag(orjson.dumps(person_full)),
+                             expire=PERSON_CACHE_EXPIRE_IN_SECONDS, shadow=True)
 
     async def _get_person_full(self, person_id: str) -> Dict[str, List[str]]:
-        ids_films_writer = await self.role_films(person_id=person_id, role='writers')
-        ids_films_director = await self.role_films(person_id=person_id, role='directors')
-        ids_films_actor = await self.role_films(person_id=person_id, role='actors')
-
-        role_list = {
-            'writer': ids_films_writer,
-            'director': ids_films_director,
-            'actor': ids_films_actor
-        }
-        return role_list
-
-    async def role_films(self, person_id: str, role: str) -> list:
+        # Все три роли собираем одним запросом: какая роль совпала, видно по matched_queries.
+        # Из индекса берём только идентификаторы фильмов, а длинную фильмографию читаем страницами
+        role_list = {role: [] for role in PERSON_ROLES.values()}
         body = {
+            'size': ROLE_FILMS_PAGE_SIZE,
+            '_source': False,
             'query': {
                 'bool': {
-                    'filter': {
-                        'nested': {
-                            'path': role,
-                            'query': {
-                                'bool': {
-                                    'filter': {
-                                        'term': {role + '.id': person_id}
-                                    }
-                                }
-                            }
+                    'should': [self.role_films(person_id, field) for field in PERSON_ROLES],
+                    'minimum_should_match': 1
+                }
+            },
+            'sort': [{'id': 'asc'}]
+        }
+        while True:
+            doc = await search(self.elastic, 'movies', body=body)
+            hits = doc['hits']['hits']
+            for hit in hits:
+                for field in hit.get('matched_queries', []):
+                    role_list[PERSON_ROLES[field]].append(hit['_id'])
+            if len(hits) < ROLE_FILMS_PAGE_SIZE:
+                break
+            body['search_after'] = hits[-1]['sort']
+
+        return role_list
+
+    @staticmethod
+    def role_films(person_id: str, role: str) -> Dict:
+        return {
+            'nested': {
+                '_name': role,
+                'path': role,
+                'query': {
+                    'bool': {
+                        'filter': {
+                            'term': {role + '.id': person_id}
                         }
                     }
                 }
             }
         }
-        ids_films = await self.search_role_ids(body=body)
-        return ids_films
 
-    async def search_role_ids(self, body: Dict):
-        doc = await self.elastic.search(index='movies', body=body, size=10000)
-        ids_films = [x['_source']['id'] for x in doc['hits']['hits']]
-        return ids_films
+    async def person_search_after(self, query: str, page_size: int,
+                                  after: Optional[list]) -> Tuple[List[Person], Optional[list]]:
+        body = {
+            'size': page_size,
+            'query': search_query(query, PERSON_SEARCH_FIELDS),
+            'sort': [{'_score': 'desc'}, {'id': 'asc'}]
+        }
+        doc = await search_after(self.elastic, 'persons', body, after)
+        hits = doc['hits']['hits']
+        persons = [Person(**x['_source']) for x in hits]
+        last_sort = hits[-1]['sort'] if hits and len(hits) == page_size else None
+        return persons, last_sort
 
     async def person_search(self, query: str, page_size: int, page_number: int):
+        key = make_key('person:search', query=query, page_size=page_size, page_number=page_number)
+        data = await self.cache.get(key)
+        if data is not None:
+            return [Person(**x) for x in codec.loads(data)]
         body = {
             'size': page_size,
             'from': (page_number - 1) * page_size,
-            'query': {
-                'simple_query_string': {
-                    "query": query,
-                    "fields": ["full_name"],
-                    "default_operator": "or"
-                }
-            }
+            'query': search_query(query, PERSON_SEARCH_FIELDS)
         }
-        doc = await self.elastic.search(index='persons', body=body, size=10000)
+        try:
+            doc = await search(self.elastic, 'persons', body=body)
+        except UNAVAILABLE_ERRORS:
+            data = await self.cache.get_shadow(key)
+            if data is None:
+                raise
+            return [Person(**x) for x in codec.loads(data)]
         persons = [Person(**x['_source']) for x in doc['hits']['hits']]
+        await self.cache.set(key, codec.dumps([x.dict() for x in persons]),
+                             expire=PERSON_SEARCH_CACHE_EXPIRE_IN_SECONDS, shadow=True)
         return persons
 
 
 @lru_cache()
 def get_person_service(
-        redis: Redis = Depends(get_redis),
+        cache: Cache = Depends(get_cache),
         elastic: AsyncElasticsearch = Depends(get_elastic),
 ) -> PersonService:
-    return PersonService(redis, elastic)
+    return PersonService(cache, elastic)
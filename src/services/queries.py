@@ -0,0 +1,16 @@
+from typing import Dict, List
+
+# Поля полнотекстового поиска: фасеты жанров считают фильмы по тому же запросу, что и поиск фильмов
+FILM_SEARCH_FIELDS = ['title^3', 'description']
+PERSON_SEARCH_FIELDS = ['full_name']
+
+
+def search_query(query: str, fields: List[str]) -> Dict:
+    """Запрос пользователя по полям индекса; синтаксис simple_query_string не падает на опечатках в операторах."""
+    return {
+        'simple_query_string': {
+            "query": query,
+            "fields": fields,
+            "default_operator": "or"
+        }
+    }
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import orjson
+from elasticsearch import AsyncElasticsearch
+from fastapi import Depends
+
+from core import config
+from db.cache import Cache, get_cache, make_key
+from db.elastic import get_elastic, multi_search, UNAVAILABLE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_CACHE_EXPIRE_IN_SECONDS = config.SUGGEST_CACHE_EXPIRE_IN_SECONDS
+SUGGEST_TIMEOUT_IN_SECONDS = config.SUGGEST_TIMEOUT_MS / 1000
+# Индекс -> (поле с подсказкой и подписью, ключ в ответе, порядок при равной релевантности)
+SUGGEST_SOURCES: Dict[str, Tuple[str, str, List]] = {
+    'movies': ('title', 'films', ['_score', {'imdb_rating': 'desc'}]),
+    'persons': ('full_name', 'persons', ['_score']),
+}
+
+
+class SuggestService:
+    """
+    Подсказки при наборе: поиск по префиксам слов в подполях .suggest (edge n-gram) названий фильмов
+    и имён персон. Оба индекса опрашиваются одним _msearch, из документов берутся только id и подпись.
+    """
+
+    def __init__(self, cache: Cache, elastic: AsyncElasticsearch):
+        self.cache = cache
+        self.elastic = elastic
+
+    async def suggest_raw(self, query: str, size: int) -> bytes:
+        # Популярные префиксы повторяются у множества клиентов, поэтому готовый ответ держим в кеше недолго
+        key = make_key('suggest', query=query, size=size)
+        data = await self.cache.get(key)
+        if data is not None:
+            return data
+        try:
+            suggestions = await asyncio.wait_for(self._suggest(query, size), SUGGEST_TIMEOUT_IN_SECONDS)
+        except (asyncio.TimeoutError, *UNAVAILABLE_ERRORS) as error:
+            # Подсказка, пришедшая позже следующего нажатия клавиши, никому не нужна: отвечаем пустым списком
+            # и не кешируем его, чтобы следующий запрос попробовал снова
+            logger.warning('Suggest for %r skipped: %s', query, type(error).__name__)
+            return orjson.dumps({name: [] for _, name, _ in SUGGEST_SOURCES.values()})
+        data = orjson.dumps(suggestions)
+        await self.cache.set(key, data, expire=SUGGEST_CACHE_EXPIRE_IN_SECONDS)
+        return data
+
+    async def _suggest(self, query: str, size: int) -> Dict[str, List[dict]]:
+        searches = [
+            (index, self._suggest_body(field, sort, query, size))
+            for index, (field, _, sort) in SUGGEST_SOURCES.items()
+        ]
+        doc = await multi_search(self.elastic, searches)
+        suggestions = {}
+        for (field, name, _), response in zip(SUGGEST_SOURCES.values(), doc['responses']):
+            hits = response.get('hits', {}).get('hits', [])
+            suggestions[name] = [{'uuid': x['_source']['id'], 'label': x['_source'][field]} for x in hits]
+        return suggestions
+
+    @staticmethod
+    def _suggest_body(field: str, sort: List, query: str, size: int) -> Dict:
+        return {
+            'size': size,
+            '_source': ['id', field],
+            # Шардам даём тот же бюджет: лучше неполный ответ, чем опоздавший
+            'timeout': f'{config.SUGGEST_TIMEOUT_MS}ms',
+            'query': {
+                'match': {
+                    field + '.suggest': {
+                        'query': query,
+                        'operator': 'and'
+                    }
+                }
+            },
+            # Среди одинаково подходящих фильмов первыми показываем популярные
+            'sort': sort,
+        }
+
+
+@lru_cache()
+def get_suggest_service(
+        cache: Cache = Depends(get_cache),
+        elastic: AsyncElasticsearch = Depends(get_elastic),
+) -> SuggestService:
+    return SuggestService(cache, elastic)
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import orjson
+
+from core import config
+from db import elastic
+from services.genre import genre_catalog
+
+logger = logging.getLogger(__name__)
+
+# Сортировки и размер страницы, с которыми фронтенд открывает каталог
+WARMUP_SORTS = ('-imdb_rating', 'imdb_rating')
+WARMUP_PAGE_SIZE = 50
+
+
+async def get(app, path: str, params: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+    """
+    GET-запрос к приложению в обход сети. Прогрев идёт через те же ручки, что и живой трафик,
+    поэтому заполняет кеш процесса ровно теми записями, которые потом понадобятся.
+    """
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': urlencode(params or {}).encode(),
+        'headers': [(b'host', b'warmup')],
+        'client': ('127.0.0.1', 0),
+        'server': ('warmup', 80),
+    }
+    status = 0
+    body = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            body.append(message.get('body', b''))
+
+    await app(scope, receive, send)
+    return status, b''.join(body)
+
+
+async def open_elastic_pool(connections: int):
+    # Одновременные запросы заставляют пул aiohttp открыть столько же соединений, и они остаются в keep-alive
+    results = await asyncio.gather(*(elastic.es.ping() for _ in range(connections)))
+    if not all(results):
+        logger.warning('Elasticsearch did not answer during warm-up')
+
+
+async def prime_caches(app):
+    semaphore = asyncio.Semaphore(config.WARMUP_CONCURRENCY)
+
+    async def fetch(path: str, params: Optional[Dict[str, str]] = None) -> Optional[bytes]:
+        async with semaphore:
+            try:
+                status, body = await get(app, path, params)
+            except Exception as error:
+                # Ошибка одной ручки не должна отменять остальной прогрев
+                logger.warning('Warm-up request %s %s failed: %r', path, params or '', error)
+                return None
+        if status != 200:
+            logger.warning('Warm-up request %s %s returned %s', path, params or '', status)
+            return None
+        return body
+
+    await asyncio.gather(fetch('/api/v1/genre/'), fetch('/api/v1/genre/facets/'))
+
+    # Первые страницы каталога: общие и по каждому жанру
+    pages = [{'sort': sort, 'page[size]': str(WARMUP_PAGE_SIZE)} for sort in WARMUP_SORTS]
+    pages.extend({'filter[genre]': str(x.id), 'page[size]': str(WARMUP_PAGE_SIZE)} for x in genre_catalog.genres)
+    bodies = await asyncio.gather(*(fetch('/api/v1/film/', x) for x in pages))
+
+    # Карточки фильмов с первой страницы по рейтингу — самые просматриваемые
+    film_ids: List[str] = [x['uuid'] for x in orjson.loads(bodies[0] or b'[]')]
+    await asyncio.gather(*(fetch('/api/v1/film/<uuid:UUID>/', {'film_id': x}) for x in film_ids))
+
+
+async def warm_up(app):
+    """
+    Открывает соединения с Elasticsearch и наполняет кеш процесса до того, как воркер начнёт принимать запросы.
+    Ошибки прогрева не мешают запуску: воркер с холодным кешем лучше, чем воркер, который не стартовал.
+    """
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(
+                open_elastic_pool(min(config.ELASTIC_POOL_SIZE, config.WARMUP_CONCURRENCY)),
+                prime_caches(app),
+            ),
+            config.WARMUP_TIMEOUT_SECONDS,
+        )
+    except asyncio.TimeoutError:
+        logger.warning('Warm-up did not finish in %ss', config.WARMUP_TIMEOUT_SECONDS)
+    except Exception:
+        # Например, индекса ещё нет, потому что ETL не запускался: воркер всё равно должен подняться
+        logger.exception('Warm-up failed')
+    else:
+        logger.info('Warm-up finished in %.2fs', time.perf_counter() - started)